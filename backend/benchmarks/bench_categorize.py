@@ -0,0 +1,69 @@
+"""Accuracy and per-row cost of transaction auto-categorization.
+
+Scores categorize() on the labeled set in categories.csv. The "train" rows
+were written alongside CATEGORY_KEYWORDS, so they are in-sample; only the
+"heldout" rows say how the dictionary does on descriptions it wasn't tuned
+for. Don't tune the dictionary on the held-out rows. A miss (None) counts as
+"general". Runs against a scratch copy of the seed DB.
+
+    python benchmarks/bench_categorize.py
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categories.csv")
+ROWS = 20000
+
+
+def accuracy(main, cursor, rows):
+    by_split = defaultdict(lambda: [0, 0])
+    misses = []
+    for row in rows:
+        predicted = main.categorize(cursor, 1, row["description"]) or "general"
+        by_split[row["split"]][1] += 1
+        if predicted == row["category"]:
+            by_split[row["split"]][0] += 1
+        elif row["split"] == "heldout":
+            misses.append((row["description"], row["category"], predicted))
+
+    for split, (correct, total) in by_split.items():
+        print(f"{split:8} {correct:3}/{total:<3} ({correct / total:6.1%})")
+    for description, expected, predicted in misses:
+        print(f"  miss: {description!r} expected {expected}, got {predicted}")
+
+
+def per_row_cost(main, cursor, rows):
+    descriptions = [f"{rows[i % len(rows)]['description']} {i}" for i in range(ROWS)]
+    main.match_category.cache_clear()
+    for label, func in (
+        # __wrapped__ skips the lru_cache memo
+        ("trie, uncached", lambda d: main.match_category.__wrapped__(main.normalize_description(d))),
+        ("trie, cached", lambda d: main.match_category(main.normalize_description(d))),
+        ("categorize", lambda d: main.categorize(cursor, 1, d)),
+    ):
+        started = time.perf_counter()
+        for description in descriptions:
+            func(description)
+        print(f"{label:15} {(time.perf_counter() - started) / ROWS * 1e6:6.1f} us/row")
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp()
+    shutil.copy2(os.path.join(BACKEND_DIR, "budgetguard.db"), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    with open(LABELS_PATH, newline="") as f:
+        rows = list(csv.DictReader(f))
+    with main.get_db() as conn:
+        cursor = conn.cursor()
+        accuracy(main, cursor, rows)
+        per_row_cost(main, cursor, rows)
+    shutil.rmtree(workdir)
@@ -0,0 +1,91 @@
+"""Dashboard serialization cost and bytes on the wire.
+
+For one user with 1k, 10k and 100k transactions in the current month,
+compares the legacy path (stdlib json over jsonable_encoder, with the old
+chart_data points that repeated timestamp and id) against what the app
+ships (pydantic DashboardResponse dumped by orjson), and reports the full
+request time and the gzipped size actually sent. Runs against a scratch
+copy of the seed DB.
+
+    python benchmarks/bench_dashboard.py
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (1000, 10000, 100000)
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def legacy_shape(data):
+    data = dict(data)
+    data["chart_data"] = [
+        {"timestamp": data["transactions"][point["txn"]]["timestamp"], "amount": point["amount"],
+         "transaction_id": data["transactions"][point["txn"]]["id"]}
+        for point in data["chart_data"]
+    ]
+    return data
+
+
+async def measure(main, client, size):
+    username = f"bench-{size}"
+    token = (await client.post("/register", json={"username": username, "password": "pw"})).json()["token"]
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+        conn.execute("UPDATE users SET monthly_budget = 1000000 WHERE id = ?", (user_id,))
+        conn.executemany("""
+            INSERT INTO transactions (user_id, amount, description, category, timestamp)
+            VALUES (?, ?, ?, 'food', datetime('now', 'start of month', ?))
+        """, [(user_id, 1 + i % 50, f"Coffee #{i}", f"+{i % 28} seconds") for i in range(size)])
+        conn.commit()
+
+    data = await main.get_dashboard(token)
+    legacy = legacy_shape(data)
+    legacy_body, legacy_ms = timed(lambda: json.dumps(jsonable_encoder(legacy)).encode())
+    body, current_ms = timed(lambda: orjson.dumps(
+        main.DashboardResponse.model_validate(data).model_dump(mode="json", exclude_unset=True)
+    ))
+
+    started = time.perf_counter()
+    async with client.stream("GET", "/dashboard", params={"token": token},
+                             headers={"Accept-Encoding": "gzip"}) as response:
+        wire = sum([len(chunk) async for chunk in response.aiter_raw()])
+    request_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{size // 1000:>4}k | {legacy_ms:7.0f} ms {len(legacy_body) / 1024:7.0f} KiB "
+          f"| {current_ms:7.0f} ms {len(body) / 1024:7.0f} KiB "
+          f"| {request_ms:7.0f} ms {wire / 1024:6.0f} KiB")
+
+
+async def run(main):
+    print(" txns | legacy json + jsonable_encoder | orjson + model           | full request, gzip on wire")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for size in SIZES:
+            await measure(main, client, size)
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp()
+    shutil.copy2(os.path.join(BACKEND_DIR, "budgetguard.db"), workdir)
+    os.chdir(workdir)
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    asyncio.run(run(main))
+    shutil.rmtree(workdir)
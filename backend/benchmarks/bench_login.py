@@ -0,0 +1,74 @@
+"""Login burst vs. latency of other routes.
+
+Fires 100 concurrent logins while probing GET / every 20 ms, once with
+hashing offloaded (the app as shipped) and once with scrypt run inline on
+the event loop. Runs against a scratch copy of the seed DB.
+
+    python benchmarks/bench_login.py
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGINS = 100
+PROBE_INTERVAL = 0.02
+
+
+async def burst(main, username):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json={"username": username, "password": "pw"})
+        latencies = []
+
+        async def probe():
+            base = time.perf_counter()
+            for i in range(LOGINS):
+                due = base + i * PROBE_INTERVAL
+                await asyncio.sleep(max(0, due - time.perf_counter()))
+                await client.get("/")
+                # Measured from when the probe was due, so event-loop stalls count
+                latencies.append(time.perf_counter() - due)
+
+        started = time.perf_counter()
+        prober = asyncio.create_task(probe())
+        await asyncio.gather(*[
+            client.post("/login", json={"username": username, "password": "pw"}) for _ in range(LOGINS)
+        ])
+        elapsed = time.perf_counter() - started
+        await prober
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    return LOGINS / elapsed, p50, p99
+
+
+async def run(main):
+    results = {"offloaded": await burst(main, "bench-offloaded")}
+
+    async def inline(func, *args):
+        return func(*args)
+    main.run_password_job = inline
+    results["inline"] = await burst(main, "bench-inline")
+
+    for label, (throughput, p50, p99) in results.items():
+        print(f"{label:10} {throughput:6.1f} logins/s | GET / p50 {p50:8.1f} ms, p99 {p99:8.1f} ms")
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp()
+    shutil.copy2(os.path.join(BACKEND_DIR, "budgetguard.db"), workdir)
+    os.chdir(workdir)
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    print(f"cpus: {os.cpu_count()}, PASSWORD_WORKERS: {main.PASSWORD_WORKERS}")
+    asyncio.run(run(main))
+    shutil.rmtree(workdir)
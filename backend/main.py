@@ -1,13 +1,31 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, WebSocket, WebSocketDisconnect
 from starlette.types import ASGIApp, Scope, Receive, Send
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
 import sqlite3
 import hashlib
+import hmac
 import secrets
-from contextlib import contextmanager
+import json
+import base64
+import re
+import csv
+import io
+import orjson
+import asyncio
+import threading
+import time
+import math
+from urllib.parse import parse_qs
+from itertools import accumulate, islice
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from sortedcontainers import SortedList
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
@@ -20,7 +38,7 @@ class VercelMiddleware:
         self.app = app
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
-        if scope["type"] == "http":
+        if scope["type"] in ("http", "websocket"):
             path = scope["path"]
             if path.startswith("/api/"):
                 scope["path"] = path[4:]
@@ -36,7 +54,135 @@ class VercelMiddleware:
                     scope["root_path"] = "/api"
         await self.app(scope, receive, send)
 
-app = FastAPI(title="BudgetGuard API v2")
+# Admission control
+# Per-token and per-IP token buckets for each route class, plus a global cap
+# on in-flight requests with a short queue. Overload gets a fast 429.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMITS = {
+    # route class: (tokens per second, burst)
+    "read": (10.0, 40),
+    "write": (5.0, 20),
+    "auth": (1.0, 10),
+    "ai": (0.2, 5),
+    "export": (0.05, 3),
+}
+IP_LIMIT_MULTIPLIER = 4  # several users can share one IP (NAT, offices)
+ROUTE_CLASSES = {
+    "/check_scam": "ai",
+    "/ai_advisor": "ai",
+    "/login": "auth",
+    "/register": "auth",
+    "/dashboard": "write",  # refreshes streaks on every call
+    "/export": "export",
+    "/admin/export": "export",
+}
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "64"))
+MAX_QUEUED_REQUESTS = int(os.environ.get("MAX_QUEUED_REQUESTS", "128"))
+QUEUE_TIMEOUT = 2.0
+
+class InProcessRateLimitStore:
+    """Token buckets kept in this process.
+
+    Any object with an async `take` of the same signature (e.g. one backed by
+    a shared cache) can be assigned to `rate_limit_store` for multi-worker setups.
+    """
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        # Least recently used first, so eviction is O(1)
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+        if len(self.buckets) > self.MAX_BUCKETS:
+            # The oldest bucket has usually refilled, so forgetting it is harmless
+            self.buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+rate_limit_store = InProcessRateLimitStore()
+
+def route_class(method: str, path: str) -> str:
+    if path in ROUTE_CLASSES:
+        return ROUTE_CLASSES[path]
+    return "read" if method in ("GET", "HEAD") else "write"
+
+class AdmissionControlMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.waiting = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        
+        # Rate limits
+        route = route_class(scope["method"], scope["path"])
+        rate, burst = RATE_LIMITS[route]
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token", [None])[0]
+        # The IP bucket goes first so one client can't mint unlimited token buckets
+        retry_after = await rate_limit_store.take(
+            f"{route}:ip:{client_ip(scope)}", rate * IP_LIMIT_MULTIPLIER, burst * IP_LIMIT_MULTIPLIER
+        )
+        if token and not retry_after:
+            retry_after = await rate_limit_store.take(f"{route}:token:{token}", rate, burst)
+        if retry_after:
+            await self.reject(scope, receive, send, "Rate limit exceeded", retry_after)
+            return
+        
+        # Global concurrency cap with a bounded queue
+        if self.waiting >= MAX_QUEUED_REQUESTS:
+            await self.reject(scope, receive, send, "Server busy", 1)
+            return
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.reject(scope, receive, send, "Server busy", 1)
+            return
+        finally:
+            self.waiting -= 1
+        
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.slots.release()
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send, detail: str, retry_after: float):
+        response = ORJSONResponse(
+            {"detail": detail},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+        await response(scope, receive, send)
+
+def client_ip(scope: Scope) -> str:
+    if os.environ.get("VERCEL"):
+        # Behind Vercel's proxy the real client is the first forwarded address
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode().split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background jobs run in-process for the lifetime of the server
+    scheduler = asyncio.create_task(nightly_scheduler())
+    checkpointer = asyncio.create_task(checkpoint_scheduler()) if memory_conn else None
+    yield
+    scheduler.cancel()
+    if checkpointer:
+        checkpointer.cancel()
+        await asyncio.to_thread(checkpoint_memory_db)
+
+app = FastAPI(title="BudgetGuard API v2", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Configure Gemini API
 # On Vercel, this will come from environment variables
@@ -46,6 +192,9 @@ if GEMINI_API_KEY:
 else:
     print("⚠️ Warning: GEMINI_API_KEY not found in environment variables")
 
+# Admission control sits inside CORS so 429s still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -53,8 +202,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets cross-origin clients read how long to back off after a 429
+    expose_headers=["Retry-After"],
 )
 
+# Compress larger payloads (dashboard, history); small responses aren't worth it
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 if os.environ.get("VERCEL"):
     app.add_middleware(VercelMiddleware)
 
@@ -70,6 +224,22 @@ if os.environ.get("VERCEL") or not os.access(".", os.W_OK):
 else:
     DB_PATH = "budgetguard.db"
 
+# Optional in-memory mode: the whole DB is served from one shared in-memory
+# connection and checkpointed to CHECKPOINT_DIR (or DB_PATH) on an interval.
+MEMORY_DB = os.environ.get("MEMORY_DB") == "1"
+CHECKPOINT_INTERVAL = int(os.environ.get("CHECKPOINT_INTERVAL", "30"))
+if os.environ.get("CHECKPOINT_DIR"):
+    CHECKPOINT_PATH = os.path.join(os.environ["CHECKPOINT_DIR"], "budgetguard.db")
+else:
+    CHECKPOINT_PATH = DB_PATH
+
+# Closed months older than this are moved out of the hot DB into archive files.
+# Archives sit next to the durable copy of the DB, so archive_index never
+# outlives the files it points at.
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(CHECKPOINT_PATH), "archive"))
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("ARCHIVE_AFTER_MONTHS", "3"))
+ARCHIVED_TABLES = ("transactions", "scam_checks")
+
 # Helper to ensure DB exists in /tmp if needed
 def ensure_db_exists():
     if DB_PATH.startswith("/tmp") and not os.path.exists(DB_PATH):
@@ -80,10 +250,111 @@ def ensure_db_exists():
             # Otherwise allow init_db to create it
             pass
 
-ensure_db_exists()
+memory_conn: Optional[sqlite3.Connection] = None
+memory_lock = threading.RLock()
+memory_stats = {
+    "hydration_ms": 0.0,
+    "checkpoints": 0,
+    "last_checkpoint_ms": 0.0,
+    "checkpointed_changes": 0,
+    "last_checkpoint_stall_ms": 0.0,
+    # When the oldest write not yet in a checkpoint happened (None if there is none)
+    "unsaved_since": None
+}
+
+def hydrate_memory_db():
+    """Load the durable checkpoint (or the seed DB) into the shared in-memory connection"""
+    global memory_conn
+    started = time.perf_counter()
+    memory_conn = sqlite3.connect(":memory:", check_same_thread=False)
+    memory_conn.row_factory = sqlite3.Row
+    
+    source_path = CHECKPOINT_PATH if os.path.exists(CHECKPOINT_PATH) else "budgetguard.db"
+    if os.path.exists(source_path):
+        source = sqlite3.connect(source_path)
+        try:
+            source.backup(memory_conn)
+        finally:
+            source.close()
+    
+    memory_stats["hydration_ms"] = (time.perf_counter() - started) * 1000
+    print(f"💾 Hydrated in-memory DB from {source_path} in {memory_stats['hydration_ms']:.1f} ms")
+
+def checkpoint_memory_db() -> bool:
+    """Copy the in-memory DB to CHECKPOINT_PATH if anything changed since the last checkpoint.
+
+    Only taking the image holds memory_lock (serialize is a memcpy); the file
+    is written after requests have the DB back. A stepped backup doesn't
+    help here: SQLite restarts it whenever the in-memory source is written
+    between steps, so under steady traffic it would never finish.
+    """
+    with memory_lock:
+        changes = memory_conn.total_changes
+        if changes == memory_stats["checkpointed_changes"]:
+            return False
+        started = time.perf_counter()
+        imaged_at = time.time()
+        image = memory_conn.serialize()
+        stall = time.perf_counter() - started
+    
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH) or ".", exist_ok=True)
+    # Write beside the target and rename, so a crash never leaves a torn file
+    temp_path = CHECKPOINT_PATH + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(image)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, CHECKPOINT_PATH)
+    
+    memory_stats["checkpoints"] += 1
+    memory_stats["last_checkpoint_ms"] = (time.perf_counter() - started) * 1000
+    memory_stats["last_checkpoint_stall_ms"] = stall * 1000
+    with memory_lock:
+        memory_stats["checkpointed_changes"] = changes
+        # Writes that landed while the file was written are no older than the image
+        memory_stats["unsaved_since"] = imaged_at if memory_conn.total_changes != changes else None
+    return True
+
+def memory_db_status() -> dict:
+    unsaved_since = memory_stats["unsaved_since"]
+    return {
+        "mode": "memory",
+        "hydration_ms": round(memory_stats["hydration_ms"], 1),
+        "checkpoints": memory_stats["checkpoints"],
+        "last_checkpoint_ms": round(memory_stats["last_checkpoint_ms"], 1),
+        # How long that checkpoint held the DB, i.e. the most a request waited on it
+        "last_checkpoint_stall_ms": round(memory_stats["last_checkpoint_stall_ms"], 1),
+        # Writes made since the last checkpoint are lost if the instance dies now
+        "unsaved_seconds": round(time.time() - unsaved_since, 1) if unsaved_since else 0
+    }
+
+async def checkpoint_scheduler():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await asyncio.to_thread(checkpoint_memory_db)
+        except Exception as e:
+            print(f"❌ Checkpoint failed: {str(e)}")
+
+if MEMORY_DB:
+    hydrate_memory_db()
+else:
+    ensure_db_exists()
 
 @contextmanager
 def get_db():
+    if memory_conn is not None:
+        with memory_lock:
+            try:
+                yield memory_conn
+            finally:
+                # The connection is shared, so never leave a transaction behind
+                if memory_conn.in_transaction:
+                    memory_conn.rollback()
+                if memory_stats["unsaved_since"] is None and memory_conn.total_changes != memory_stats["checkpointed_changes"]:
+                    memory_stats["unsaved_since"] = time.time()
+        return
+    
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     try:
@@ -91,6 +362,73 @@ def get_db():
     finally:
         conn.close()
 
+# Streak bitmaps
+# Savings days are stored as one bit per day of the year (bit 0 = Jan 1),
+# so a user-year fits in 46 bytes and streaks reduce to bit operations.
+STREAK_BITMAP_BYTES = 46
+HEATMAP_DAYS = 366
+
+def load_streak_bits(cursor, user_id: int, year: int) -> int:
+    cursor.execute("SELECT bits FROM streak_bitmaps WHERE user_id = ? AND year = ?", (user_id, year))
+    row = cursor.fetchone()
+    return int.from_bytes(row[0], 'little') if row else 0
+
+def save_streak_bits(cursor, user_id: int, year: int, bits: int):
+    cursor.execute(
+        "INSERT OR REPLACE INTO streak_bitmaps (user_id, year, bits) VALUES (?, ?, ?)",
+        (user_id, year, bits.to_bytes(STREAK_BITMAP_BYTES, 'little'))
+    )
+
+def set_streak_day(cursor, user_id: int, day: date, has_savings: bool):
+    bits = load_streak_bits(cursor, user_id, day.year)
+    bit = 1 << (day.timetuple().tm_yday - 1)
+    save_streak_bits(cursor, user_id, day.year, bits | bit if has_savings else bits & ~bit)
+
+def streak_window(cursor, user_id: int, end: date, days: int) -> int:
+    """Savings bits for the `days` days ending at `end` (bit 0 = oldest day)"""
+    start = end - timedelta(days=days - 1)
+    cursor.execute("""
+        SELECT year, bits FROM streak_bitmaps
+        WHERE user_id = ? AND year BETWEEN ? AND ?
+    """, (user_id, start.year, end.year))
+    
+    window = 0
+    for year, blob in cursor.fetchall():
+        shift = date(year, 1, 1).toordinal() - start.toordinal()
+        bits = int.from_bytes(blob, 'little')
+        window |= bits << shift if shift >= 0 else bits >> -shift
+    return window & ((1 << days) - 1)
+
+def trailing_run(window: int, days: int) -> int:
+    """Length of the run of savings days ending at the newest day of the window"""
+    gaps = ~window & ((1 << days) - 1)
+    return days - gaps.bit_length()
+
+def longest_run(bits: int) -> int:
+    """Longest run of consecutive set bits"""
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+def current_streak_length(cursor, user_id: int, today: date) -> int:
+    days = HEATMAP_DAYS
+    while True:
+        run = trailing_run(streak_window(cursor, user_id, today, days), days)
+        if run < days:
+            return run
+        days *= 2
+
+def iter_set_bits(bits: int):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+# users columns that can be ranked on a leaderboard
+LEADERBOARD_METRICS = ("longest_streak", "current_streak", "total_trees_planted", "coin_balance")
+
 def init_db():
     with get_db() as conn:
         cursor = conn.cursor()
@@ -142,18 +480,31 @@ def init_db():
             )
         """)
         
-        # Streak history table
+        # Streak bitmaps (one row per user per year)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS streak_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE IF NOT EXISTS streak_bitmaps (
                 user_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                has_savings INTEGER DEFAULT 0,
+                year INTEGER NOT NULL,
+                bits BLOB NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, date)
+                PRIMARY KEY (user_id, year)
             )
         """)
         
+        # Fold the legacy one-row-per-day streak history into bitmaps
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'streak_history'")
+        if cursor.fetchone():
+            cursor.execute("SELECT user_id, date FROM streak_history WHERE has_savings = 1")
+            years = {}
+            for user_id, date_str in cursor.fetchall():
+                day = datetime.strptime(date_str, '%Y-%m-%d')
+                key = (user_id, day.year)
+                years[key] = years.get(key, 0) | (1 << (day.timetuple().tm_yday - 1))
+            for (user_id, year), bits in years.items():
+                save_streak_bits(cursor, user_id, year, bits | load_streak_bits(cursor, user_id, year))
+            # Kept under another name rather than dropped, so a bad migration can be redone
+            cursor.execute("ALTER TABLE streak_history RENAME TO streak_history_migrated")
+        
         # Scam detection history
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS scam_checks (
@@ -181,6 +532,98 @@ def init_db():
             )
         """)
         
+        # Which archive months hold rows for which user (kept hot for lookups)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_index (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                row_count INTEGER DEFAULT 0,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                PRIMARY KEY (user_id, table_name, month)
+            )
+        """)
+        
+        # Friends (stored in both directions once the request is accepted)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS friendships (
+                user_id INTEGER NOT NULL,
+                friend_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (friend_id) REFERENCES users(id),
+                PRIMARY KEY (user_id, friend_id)
+            )
+        """)
+        
+        # Friend requests awaiting the addressee's answer
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS friend_requests (
+                requester_id INTEGER NOT NULL,
+                addressee_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (requester_id) REFERENCES users(id),
+                FOREIGN KEY (addressee_id) REFERENCES users(id),
+                PRIMARY KEY (requester_id, addressee_id)
+            )
+        """)
+        
+        # Opt-in public names for the global leaderboard; login names are never shown there
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard_profiles (
+                user_id INTEGER PRIMARY KEY,
+                display_name TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        
+        # History reads and exports walk newest first, per user or across everyone;
+        # without these every page of them scans and sorts the whole table
+        # (the rowid rides along in each index, so (timestamp, id) pages use it too)
+        for table in ("transactions", "scam_checks", "coin_redemptions"):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_time ON {table} (user_id, timestamp)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table} (timestamp)")
+        
+        # Leaderboard columns, indexed in rank order so loading needs no sort
+        for metric in LEADERBOARD_METRICS:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_users_{metric} ON users ({metric} DESC, id)")
+        
+        # Categories users assigned by hand, keyed by normalized description
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS category_corrections (
+                user_id INTEGER NOT NULL,
+                description_key TEXT NOT NULL,
+                category TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                PRIMARY KEY (user_id, description_key)
+            )
+        """)
+        
+        # When each background job last ran, shared by every worker and restart
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_runs (
+                name TEXT PRIMARY KEY,
+                last_run_at TIMESTAMP NOT NULL
+            )
+        """)
+        
+        # Precomputed analytics for closed months (rewritten only by category corrections)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analytics_snapshots (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                total_spend REAL DEFAULT 0,
+                txn_count INTEGER DEFAULT 0,
+                savings_days INTEGER DEFAULT 0,
+                category_totals TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                PRIMARY KEY (user_id, month)
+            )
+        """)
+        
         conn.commit()
 
 # Initialize database on startup
@@ -205,7 +648,7 @@ class SetBudgetRequest(BaseModel):
 class AddTransactionRequest(BaseModel):
     amount: float
     description: str
-    category: Optional[str] = "general"
+    category: Optional[str] = None  # inferred from the description when omitted
     is_verified: Optional[bool] = True
 
 class MarkTransactionRequest(BaseModel):
@@ -218,6 +661,15 @@ class SimulatePaymentRequest(BaseModel):
     use_emergency: bool = False
     emergency_pin: Optional[str] = None
 
+class CandidatePayment(BaseModel):
+    amount: float
+    description: Optional[str] = None
+    order: Optional[int] = None
+
+class SimulatePaymentsRequest(BaseModel):
+    payments: List[CandidatePayment]
+    cumulative: bool = True  # False evaluates each amount on its own (e.g. a slider)
+
 class ScamCheckRequest(BaseModel):
     message_text: str
 
@@ -225,10 +677,116 @@ class RedeemCoinsRequest(BaseModel):
     brand: str
     coins_required: int
 
+class AddFriendRequest(BaseModel):
+    username: str
+
+class LeaderboardProfileRequest(BaseModel):
+    display_name: Optional[str] = None  # None (or blank) hides you from the global board
+
+class SetCategoryRequest(BaseModel):
+    transaction_id: int
+    category: str
+
+# Response models
+class DashboardTransaction(BaseModel):
+    id: int
+    amount: float
+    description: str
+    category: Optional[str] = None
+    is_useful: Optional[int] = None
+    is_verified: Optional[int] = None
+    timestamp: str
+
+class ChartPoint(BaseModel):
+    txn: int  # index into DashboardResponse.transactions
+    amount: float
+
+class CategoryShare(BaseModel):
+    category: str
+    amount: float
+    percentage: float
+
+class MonthlyTrend(BaseModel):
+    month: str
+    total_spend: float
+    txn_count: int
+    savings_days: int
+    category_totals: Dict[str, float]
+
+class DashboardAnalytics(BaseModel):
+    avg_daily: float
+    avg_weekly: float
+    predicted_monthly: float
+    days_passed: int
+    days_in_month: int
+    category_breakdown: List[CategoryShare]
+    monthly_trend: List[MonthlyTrend]
+
+class HeatmapDay(BaseModel):
+    date: str
+    count: int
+
+class HeatmapBitmap(BaseModel):
+    start: str
+    days: int
+    bits: str
+
+class DashboardResponse(BaseModel):
+    username: str
+    monthly_budget: float
+    emergency_fund: float
+    current_spend: float
+    budget_remaining: float
+    budget_usage_percent: float
+    transactions: List[DashboardTransaction]
+    chart_data: List[ChartPoint]
+    coin_balance: int
+    current_streak: int
+    longest_streak: int
+    tree_progress: int
+    total_trees_planted: int
+    is_premium: bool
+    analytics: DashboardAnalytics
+    heatmap_longest_run: int
+    heatmap_data: Optional[List[HeatmapDay]] = None
+    heatmap_bitmap: Optional[HeatmapBitmap] = None
+
+
+# Password hashing
+# scrypt is deliberately slow, so hashing runs in worker threads (hashlib.scrypt
+# releases the GIL) rather than on the event loop. The semaphore caps how many
+# hashes run at once so a login burst can't take over the thread pool.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", "2"))
+password_slots = asyncio.Semaphore(PASSWORD_WORKERS)
 
-# Helper functions
 def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Salted scrypt hash encoded as scrypt$n$r$p$salt$digest"""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    if stored_hash.startswith("scrypt$"):
+        _, n, r, p, salt, digest = stored_hash.split("$")
+        candidate = hashlib.scrypt(
+            password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p), dklen=32
+        )
+        return hmac.compare_digest(candidate.hex(), digest)
+    # Legacy unsalted SHA-256
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+
+def needs_rehash(stored_hash: str) -> bool:
+    return not stored_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+async def run_password_job(func, *args):
+    """Run a hashing function in a worker thread, at most PASSWORD_WORKERS at a time"""
+    async with password_slots:
+        return await asyncio.to_thread(func, *args)
+
+# Helper functions
 
 def create_session(user_id: int) -> str:
     token = secrets.token_urlsafe(32)
@@ -255,41 +813,21 @@ def update_streak_and_trees(user_id: int):
         cursor = conn.cursor()
         
         # Get today's date
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = datetime.now().date()
         
         # Check if user has a verified transaction today
         cursor.execute("""
             SELECT COUNT(*) FROM transactions
             WHERE user_id = ? AND DATE(timestamp) = ? AND is_verified = 1
-        """, (user_id, today))
+        """, (user_id, today.strftime('%Y-%m-%d')))
         
         has_transaction_today = cursor.fetchone()[0] > 0
         
-        # Update or insert streak history for today
-        cursor.execute("""
-            INSERT OR REPLACE INTO streak_history (user_id, date, has_savings)
-            VALUES (?, ?, ?)
-        """, (user_id, today, 1 if has_transaction_today else 0))
+        # Set or clear today's bit
+        set_streak_day(cursor, user_id, today, has_transaction_today)
         
-        # Calculate current streak
-        cursor.execute("""
-            SELECT date FROM streak_history
-            WHERE user_id = ? AND has_savings = 1
-            ORDER BY date DESC
-        """, (user_id,))
-        
-        dates = [row[0] for row in cursor.fetchall()]
-        current_streak = 0
-        
-        if dates:
-            # Count consecutive days from today backwards
-            current_date = datetime.now()
-            for date_str in dates:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                if (current_date - date_obj).days == current_streak:
-                    current_streak += 1
-                else:
-                    break
+        # Calculate current streak (consecutive days from today backwards)
+        current_streak = current_streak_length(cursor, user_id, today)
         
         # Get current user data
         cursor.execute("SELECT longest_streak, tree_progress, total_trees_planted FROM users WHERE id = ?", (user_id,))
@@ -314,6 +852,7 @@ def update_streak_and_trees(user_id: int):
         """, (current_streak, longest_streak, tree_progress_display, total_trees, user_id))
         
         conn.commit()
+        refresh_leaderboards(cursor, user_id)
         
         return current_streak, tree_progress_display, total_trees
 
@@ -326,6 +865,658 @@ def award_coins(user_id: int, amount: int = 1):
             WHERE id = ?
         """, (amount, user_id))
         conn.commit()
+        refresh_leaderboards(cursor, user_id)
+
+# Leaderboards
+# Each metric keeps every user in a SortedList of (-score, user_id), so a
+# rank is a binary search, a page is a slice and an update is O(log n)
+# (a plain list would memmove on every score change). The lists are loaded
+# once from the indexed columns and then updated as scores change.
+
+class Leaderboard:
+    def __init__(self, metric: str):
+        self.metric = metric
+        self.entries = SortedList()
+        self.scores: Dict[int, int] = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def ensure_loaded(self):
+        with self.lock:
+            if self.loaded:
+                return
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT id, {self.metric} FROM users ORDER BY {self.metric} DESC, id")
+                self.entries = SortedList((-(score or 0), user_id) for user_id, score in cursor.fetchall())
+            self.scores = {user_id: -neg_score for neg_score, user_id in self.entries}
+            self.loaded = True
+
+    def update(self, user_id: int, score: int):
+        with self.lock:
+            # Before the first load there is nothing to keep in sync
+            if not self.loaded:
+                return
+            old_score = self.scores.get(user_id)
+            if old_score == score:
+                return
+            if old_score is not None:
+                self.entries.remove((-old_score, user_id))
+            self.entries.add((-score, user_id))
+            self.scores[user_id] = score
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank, ties broken by user id"""
+        self.ensure_loaded()
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.entries.bisect_left((-score, user_id)) + 1
+
+    def page(self, offset: int, limit: int) -> list:
+        self.ensure_loaded()
+        return [(user_id, -neg_score) for neg_score, user_id in self.entries[offset:offset + limit]]
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self.entries)
+
+leaderboards = {metric: Leaderboard(metric) for metric in LEADERBOARD_METRICS}
+
+def refresh_leaderboards(cursor, user_id: int):
+    cursor.execute(f"SELECT {', '.join(LEADERBOARD_METRICS)} FROM users WHERE id = ?", (user_id,))
+    row = cursor.fetchone()
+    if row:
+        for metric, score in zip(LEADERBOARD_METRICS, row):
+            leaderboards[metric].update(user_id, score or 0)
+
+def get_leaderboard(metric: str) -> Leaderboard:
+    if metric not in leaderboards:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Choose from: {', '.join(LEADERBOARD_METRICS)}")
+    return leaderboards[metric]
+
+def usernames_for(user_ids: list) -> Dict[int, str]:
+    if not user_ids:
+        return {}
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id, username FROM users WHERE id IN ({', '.join('?' * len(user_ids))})",
+            user_ids
+        )
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+def display_names_for(user_ids: list) -> Dict[int, str]:
+    """Public leaderboard names for users who opted in"""
+    if not user_ids:
+        return {}
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT user_id, display_name FROM leaderboard_profiles WHERE user_id IN ({', '.join('?' * len(user_ids))})",
+            user_ids
+        )
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+def make_friends(cursor, user_id: int, friend_id: int):
+    """Turn a friend request between two users into a friendship"""
+    cursor.executemany(
+        "INSERT OR IGNORE INTO friendships (user_id, friend_id) VALUES (?, ?)",
+        [(user_id, friend_id), (friend_id, user_id)]
+    )
+    cursor.execute("""
+        DELETE FROM friend_requests
+        WHERE (requester_id = ? AND addressee_id = ?) OR (requester_id = ? AND addressee_id = ?)
+    """, (user_id, friend_id, friend_id, user_id))
+
+# Auto-categorization
+# Merchant/keyword phrases are compiled into a token trie; a description is
+# normalized, checked against the user's own corrections, then matched
+# against the trie (longest phrase wins). Trie results are memoized.
+CATEGORY_KEYWORDS = {
+    "food": ["coffee", "cafe", "starbucks", "restaurant", "pizza", "burger", "mcdonald's", "kfc", "domino's",
+             "subway", "swiggy", "zomato", "lunch", "dinner", "breakfast", "bakery", "tea", "snacks"],
+    "groceries": ["grocery", "supermarket", "whole foods", "trader joe's", "walmart", "costco", "bigbasket",
+                  "blinkit", "zepto", "dmart", "milk", "vegetables", "fruits"],
+    "transport": ["uber", "ola", "lyft", "rapido", "taxi", "cab", "metro", "bus", "train ticket", "fuel",
+                  "petrol", "diesel", "gas station", "parking", "toll"],
+    "shopping": ["amazon", "flipkart", "myntra", "ajio", "meesho", "mall", "clothes", "shoes", "ikea", "target",
+                 "electronics"],
+    "entertainment": ["netflix", "spotify", "prime video", "hotstar", "youtube premium", "movie", "cinema", "pvr",
+                      "concert", "steam", "playstation", "game"],
+    "bills": ["electricity", "water bill", "gas bill", "internet", "wifi", "broadband", "rent", "phone bill",
+              "recharge", "airtel", "jio", "insurance", "emi"],
+    "health": ["pharmacy", "medicine", "doctor", "hospital", "clinic", "apollo", "dentist", "gym", "lab test"],
+    "travel": ["flight", "airline", "hotel", "airbnb", "booking.com", "makemytrip", "irctc", "goibibo", "trip"],
+    "education": ["course", "udemy", "coursera", "books", "tuition", "school fees", "college fees", "exam fee"],
+}
+
+def stem_token(token: str) -> str:
+    """Crude singular stem, so plural and singular forms land on the same key"""
+    if len(token) > 4 and token.endswith("ies"):
+        token = token[:-3] + "i"  # groceries -> groceri
+    elif len(token) > 4 and token.endswith("es") and token[:-2].endswith(("s", "x", "z", "ch", "sh")):
+        token = token[:-2]  # buses -> bus, classes -> class
+    elif len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        token = token[:-1]  # tickets -> ticket
+    # grocery/groceri and movie/movi (from movies) meet on the same stem
+    if len(token) > 3 and token.endswith("y"):
+        token = token[:-1] + "i"
+    elif len(token) > 3 and token.endswith("ie"):
+        token = token[:-1]
+    return token
+
+def normalize_description(description: str) -> tuple:
+    """Lowercase, drop digits/punctuation and stem each token"""
+    text = re.sub(r"[^a-z]+", " ", description.lower().replace("'", ""))
+    return tuple(stem_token(token) for token in text.split())
+
+def build_keyword_trie(keywords: Dict[str, list]) -> dict:
+    trie = {}
+    for category, phrases in keywords.items():
+        for phrase in phrases:
+            node = trie
+            for token in normalize_description(phrase):
+                node = node.setdefault(token, {})
+            node["$"] = category
+    return trie
+
+CATEGORY_TRIE = build_keyword_trie(CATEGORY_KEYWORDS)
+
+@lru_cache(maxsize=10000)
+def match_category(tokens: tuple) -> Optional[str]:
+    best_category, best_length = None, 0
+    for start in range(len(tokens)):
+        node = CATEGORY_TRIE
+        for length, token in enumerate(tokens[start:], 1):
+            node = node.get(token)
+            if node is None:
+                break
+            if "$" in node and length > best_length:
+                best_category, best_length = node["$"], length
+    return best_category
+
+def categorize(cursor, user_id: int, description: str) -> Optional[str]:
+    """Category for a description, or None (stored as NULL) when nothing matches"""
+    tokens = normalize_description(description)
+    cursor.execute(
+        "SELECT category FROM category_corrections WHERE user_id = ? AND description_key = ?",
+        (user_id, " ".join(tokens))
+    )
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    return match_category(tokens)
+
+def categorize_uncategorized() -> int:
+    """Bulk-categorize NULL rows from the current and previous month.
+
+    An explicit 'general' was chosen by the user and is left alone. Closed
+    months that change get their snapshot rewritten to match.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, user_id, description, strftime('%Y-%m', timestamp),
+                   strftime('%Y-%m', timestamp) < strftime('%Y-%m', 'now')
+            FROM transactions
+            WHERE category IS NULL
+            AND timestamp >= date('now', 'start of month', '-1 month')
+        """)
+        rows = cursor.fetchall()
+        
+        updates = []
+        closed_months = set()
+        for txn_id, user_id, description, month, is_closed in rows:
+            category = categorize(cursor, user_id, description)
+            if category:
+                updates.append((category, txn_id))
+                if is_closed:
+                    closed_months.add((user_id, month))
+        
+        cursor.executemany("UPDATE transactions SET category = ? WHERE id = ?", updates)
+        for user_id, month in closed_months:
+            save_month_snapshot(cursor, user_id, month, replace=True)
+        conn.commit()
+    return len(updates)
+
+# Analytics snapshots
+# Closed months rarely change, so their aggregates are computed once by the
+# background scheduler and requests only merge in the live current month.
+# A category correction in a closed month rewrites that month's snapshot.
+SNAPSHOT_HOUR = int(os.environ.get("SNAPSHOT_HOUR", "3"))
+SNAPSHOT_HISTORY_MONTHS = 12
+
+def compute_month_snapshot(cursor, user_id: int, month: str) -> dict:
+    """Aggregate one month ('YYYY-MM') of a user's activity"""
+    cursor.execute("""
+        SELECT COALESCE(category, 'general'), SUM(amount), COUNT(*)
+        FROM transactions
+        WHERE user_id = ?
+        AND strftime('%Y-%m', timestamp) = ?
+        GROUP BY COALESCE(category, 'general')
+    """, (user_id, month))
+    
+    category_totals = {}
+    total_spend = 0
+    txn_count = 0
+    for category, amount, count in cursor.fetchall():
+        category_totals[category] = amount
+        total_spend += amount
+        txn_count += count
+    
+    first_day = datetime.strptime(month, '%Y-%m').date()
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    month_days = (next_month - first_day).days
+    savings_days = streak_window(cursor, user_id, next_month - timedelta(days=1), month_days).bit_count()
+    
+    return {
+        "month": month,
+        "total_spend": total_spend,
+        "txn_count": txn_count,
+        "savings_days": savings_days,
+        "category_totals": category_totals
+    }
+
+def precompute_snapshots() -> int:
+    """Snapshot every closed month that has activity but no snapshot yet"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT t.user_id, strftime('%Y-%m', t.timestamp) AS month
+            FROM transactions t
+            WHERE strftime('%Y-%m', t.timestamp) < strftime('%Y-%m', 'now')
+            AND NOT EXISTS (
+                SELECT 1 FROM analytics_snapshots s
+                WHERE s.user_id = t.user_id AND s.month = strftime('%Y-%m', t.timestamp)
+            )
+        """)
+        pending = cursor.fetchall()
+        
+        for user_id, month in pending:
+            save_month_snapshot(cursor, user_id, month)
+        
+        conn.commit()
+    return len(pending)
+
+def save_month_snapshot(cursor, user_id: int, month: str, replace: bool = False):
+    """Compute and store one closed month's snapshot, overwriting it only if replace is set"""
+    snapshot = compute_month_snapshot(cursor, user_id, month)
+    cursor.execute(f"""
+        INSERT OR {"REPLACE" if replace else "IGNORE"} INTO analytics_snapshots
+        (user_id, month, total_spend, txn_count, savings_days, category_totals)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, month, snapshot['total_spend'], snapshot['txn_count'],
+          snapshot['savings_days'], json.dumps(snapshot['category_totals'])))
+
+def get_monthly_history(cursor, user_id: int) -> list:
+    """Read precomputed snapshots for recent closed months, oldest first"""
+    cursor.execute("""
+        SELECT month, total_spend, txn_count, savings_days, category_totals
+        FROM analytics_snapshots
+        WHERE user_id = ?
+        AND month >= strftime('%Y-%m', 'now', 'start of month', ?)
+        AND month < strftime('%Y-%m', 'now')
+        ORDER BY month ASC
+    """, (user_id, f"-{SNAPSHOT_HISTORY_MONTHS} months"))
+    
+    return [{
+        "month": row[0],
+        "total_spend": row[1],
+        "txn_count": row[2],
+        "savings_days": row[3],
+        "category_totals": json.loads(row[4]) if row[4] else {}
+    } for row in cursor.fetchall()]
+
+# Archival
+# Each archived month lives in its own SQLite file under ARCHIVE_DIR. The hot
+# DB keeps analytics_snapshots and archive_index so it stays small.
+def archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"budgetguard-{month}.db")
+
+def archive_closed_months() -> int:
+    """Move rows from months older than ARCHIVE_AFTER_MONTHS into archive files"""
+    # Summaries must be hot before the rows they are computed from leave
+    precompute_snapshots()
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT strftime('%Y-%m', timestamp) FROM transactions
+            WHERE timestamp < date('now', 'start of month', ?)
+            UNION
+            SELECT strftime('%Y-%m', timestamp) FROM scam_checks
+            WHERE timestamp < date('now', 'start of month', ?)
+        """, (f"-{ARCHIVE_AFTER_MONTHS} months", f"-{ARCHIVE_AFTER_MONTHS} months"))
+        months = sorted(row[0] for row in cursor.fetchall())
+        if not months:
+            return 0
+        
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        for month in months:
+            cursor.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
+            try:
+                for table in ARCHIVED_TABLES:
+                    cursor.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_user ON {table} (user_id, timestamp)")
+                    # A crash between this commit and the next checkpoint leaves the rows hot
+                    # in memory mode, so drop any copy a previous run already archived
+                    cursor.execute(f"""
+                        DELETE FROM archive.{table} WHERE id IN (
+                            SELECT id FROM main.{table} WHERE strftime('%Y-%m', timestamp) = ?
+                        )
+                    """, (month,))
+                    cursor.execute(f"""
+                        INSERT INTO archive.{table}
+                        SELECT * FROM main.{table} WHERE strftime('%Y-%m', timestamp) = ?
+                    """, (month,))
+                    cursor.execute(f"""
+                        INSERT INTO archive_index (user_id, month, table_name, row_count)
+                        SELECT user_id, ?, ?, COUNT(*) FROM main.{table}
+                        WHERE strftime('%Y-%m', timestamp) = ?
+                        GROUP BY user_id
+                        ON CONFLICT (user_id, table_name, month) DO UPDATE SET row_count = row_count + excluded.row_count
+                    """, (month, table, month))
+                    cursor.execute(f"DELETE FROM main.{table} WHERE strftime('%Y-%m', timestamp) = ?", (month,))
+                # Copy, index and delete commit together across both files
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.execute("DETACH DATABASE archive")
+        
+        # Give the freed pages back so the hot file actually shrinks
+        conn.execute("VACUUM")
+    
+    if memory_conn is not None:
+        # The archive files are already durable; persist the matching deletes now
+        checkpoint_memory_db()
+    return len(months)
+
+def history_filter(user_id: Optional[int]) -> tuple:
+    return ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+
+def archived_months(conn, table: str, user_id: Optional[int] = None) -> List[str]:
+    """Months of `table` in archive files, newest first"""
+    if table not in ARCHIVED_TABLES:
+        return []
+    user_filter, params = history_filter(user_id)
+    cursor = conn.execute(f"""
+        SELECT DISTINCT month FROM archive_index
+        {user_filter + " AND" if user_filter else "WHERE"} table_name = ?
+        ORDER BY month DESC
+    """, params + (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def iter_archive(month: str, table: str, user_id: Optional[int] = None):
+    """Yield one archived month's rows, newest first, from its own read-only connection"""
+    user_filter, params = history_filter(user_id)
+    archive = None
+    try:
+        archive = sqlite3.connect(f"file:{archive_path(month)}?mode=ro", uri=True)
+        archive.row_factory = sqlite3.Row
+        rows = archive.execute(f"SELECT * FROM {table} {user_filter} ORDER BY timestamp DESC", params)
+    except sqlite3.Error as e:
+        # A lost or damaged archive shouldn't take the hot history down with it
+        if archive is not None:
+            archive.close()
+        print(f"⚠️ Skipping archived {table} for {month}: {str(e)}")
+        return
+    try:
+        yield from rows
+    finally:
+        archive.close()
+
+def iter_history(conn, table: str, user_id: Optional[int] = None):
+    """Yield rows from the hot table, then its archived months, newest first.
+
+    Limited to one user unless user_id is None.
+    """
+    user_filter, params = history_filter(user_id)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {table} {user_filter} ORDER BY timestamp DESC", params)
+    yield from cursor
+    
+    for month in archived_months(conn, table, user_id):
+        yield from iter_archive(month, table, user_id)
+
+def job_ran_within(name: str, interval: str) -> bool:
+    """Whether `name` last ran within `interval` (an SQLite modifier such as '-1 day')"""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM job_runs WHERE name = ? AND last_run_at >= datetime('now', ?)",
+            (name, interval)
+        ).fetchone()
+    return row is not None
+
+def claim_job_run(name: str, interval: str) -> bool:
+    """Record a run of `name` now unless one happened within `interval`.
+
+    Checking and recording is one statement, so of several workers waking
+    up for the same window only one gets to run the job.
+    """
+    with get_db() as conn:
+        cursor = conn.execute("""
+            INSERT INTO job_runs (name, last_run_at) VALUES (?, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE SET last_run_at = excluded.last_run_at
+            WHERE job_runs.last_run_at < datetime('now', ?)
+        """, (name, interval))
+        conn.commit()
+        return cursor.rowcount == 1
+
+async def nightly_scheduler():
+    """Run categorization, snapshot and archival jobs nightly in the off-peak window.
+
+    Startup happens on every worker, reload and cold start, often at peak
+    load, so it only catches up on snapshots (which dashboards need) and
+    only when the nightly run is overdue. The heavier jobs wait for the window.
+    """
+    if not job_ran_within("nightly", "-1 day"):
+        try:
+            count = await asyncio.to_thread(precompute_snapshots)
+            print(f"📊 Precomputed {count} analytics snapshot(s) on startup")
+        except Exception as e:
+            print(f"❌ Startup snapshot catch-up failed: {str(e)}")
+    
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=SNAPSHOT_HOUR, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        
+        # Another worker may already have taken tonight's run
+        if not claim_job_run("nightly", "-20 hours"):
+            continue
+        try:
+            categorized = await asyncio.to_thread(categorize_uncategorized)
+            print(f"🏷️  Categorized {categorized} transaction(s)")
+            count = await asyncio.to_thread(precompute_snapshots)
+            print(f"📊 Precomputed {count} analytics snapshot(s)")
+            archived = await asyncio.to_thread(archive_closed_months)
+            print(f"🗄️  Archived {archived} closed month(s)")
+        except Exception as e:
+            print(f"❌ Nightly job failed: {str(e)}")
+
+# Live updates
+# Write endpoints publish small deltas to a per-user channel and connected
+# clients apply them instead of refetching the whole dashboard.
+class InProcessBroker:
+    """Per-user pub/sub backed by asyncio queues in this process.
+
+    Any object with the same subscribe/unsubscribe/publish methods can be
+    assigned to `broker` to fan events out through an external broker.
+    """
+    QUEUE_SIZE = 100
+    # A few tabs and devices per user; sockets past this are refused
+    MAX_SUBSCRIPTIONS_PER_USER = int(os.environ.get("MAX_SOCKETS_PER_USER", "5"))
+
+    def __init__(self):
+        self.subscribers: Dict[int, set] = {}
+
+    def subscribe(self, user_id: int) -> Optional[asyncio.Queue]:
+        """Return a queue for the user's events, or None if they're at the subscription cap"""
+        queues = self.subscribers.setdefault(user_id, set())
+        if len(queues) >= self.MAX_SUBSCRIPTIONS_PER_USER:
+            return None
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    async def publish(self, user_id: int, event: dict):
+        for queue in list(self.subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client fell behind; drop its backlog and ask it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+broker = InProcessBroker()
+
+def user_stats_event(user_id: int) -> dict:
+    """Current coin/streak counters for inclusion in a live update"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT coin_balance, current_streak, longest_streak, tree_progress, total_trees_planted
+            FROM users WHERE id = ?
+        """, (user_id,))
+        return dict(cursor.fetchone())
+
+# Export
+# Rows stream from the cursor in fixed-size batches and are encoded batch by
+# batch, so memory stays flat regardless of how much history there is.
+EXPORT_DATASETS = {
+    "transactions": "transactions",
+    "scam_checks": "scam_checks",
+    "redemptions": "coin_redemptions",
+}
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_BATCH_ROWS = 1000
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def export_batches(table: str, user_id: Optional[int]):
+    """Yield history in batches, newest first, holding the DB only while each batch is read.
+
+    Hot rows are paged by (timestamp, id) so every batch is a fresh, short
+    query; archived months are read from their own files without the DB.
+    """
+    after = None
+    while True:
+        conditions, page_params = (["user_id = ?"], (user_id,)) if user_id is not None else ([], ())
+        if after:
+            conditions.append("(timestamp, id) < (?, ?)")
+            page_params += after
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with get_db() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM {table} {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                page_params + (EXPORT_BATCH_ROWS,)
+            ).fetchall()
+            if len(rows) < EXPORT_BATCH_ROWS:
+                months = archived_months(conn, table, user_id)
+        if rows:
+            yield [tuple(row) for row in rows]
+        if len(rows) < EXPORT_BATCH_ROWS:
+            break
+        after = (rows[-1]["timestamp"], rows[-1]["id"])
+    
+    for month in months:
+        archive_rows = iter_archive(month, table, user_id)
+        while True:
+            batch = [tuple(row) for row in islice(archive_rows, EXPORT_BATCH_ROWS)]
+            if not batch:
+                break
+            yield batch
+
+def encode_csv(columns: list, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+
+def encode_ndjson(columns: list, batches):
+    for batch in batches:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+def encode_parquet(columns: list, column_types: list, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    schema = pa.schema([(name, arrow_types.get(kind, pa.string())) for name, kind in zip(columns, column_types)])
+    sink = io.BytesIO()
+    
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+    
+    # One row group per batch; each is flushed to the client as soon as it's written
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=schema.field(i).type) for i, values in enumerate(zip(*batch))],
+                schema=schema
+            ))
+            yield drain()
+    yield drain()
+
+async def stream_export(table: str, user_id: Optional[int], export_format: str):
+    with get_db() as conn:
+        table_info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    columns = [col[1] for col in table_info]
+    # Batches take the DB one at a time, so nothing is held while a chunk is sent
+    batches = export_batches(table, user_id)
+    
+    if export_format == "parquet":
+        chunks = encode_parquet(columns, [col[2].upper() for col in table_info], batches)
+    elif export_format == "ndjson":
+        chunks = encode_ndjson(columns, batches)
+    else:
+        chunks = encode_csv(columns, batches)
+    
+    for chunk in chunks:
+        yield chunk
+        # Let other requests run between batches
+        await asyncio.sleep(0)
+
+def export_response(dataset: str, export_format: str, user_id: Optional[int], filename: str) -> StreamingResponse:
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=400, detail=f"Unknown dataset. Choose from: {', '.join(EXPORT_DATASETS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format. Choose from: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    
+    return StreamingResponse(
+        stream_export(EXPORT_DATASETS[dataset], user_id, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
 
 # API Endpoints
 @app.post("/register")
@@ -338,24 +1529,35 @@ async def register(request: RegisterRequest):
         cursor.execute("SELECT id FROM users WHERE username = ?", (request.username,))
         if cursor.fetchone():
             raise HTTPException(status_code=400, detail="Username already exists")
+    
+    # Hash outside the DB context so no connection (or lock) is held meanwhile
+    password_hash = await run_password_job(hash_password, request.password)
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
         
-        # Create user
-        password_hash = hash_password(request.password)
-        cursor.execute(
-            "INSERT INTO users (username, email, phone, password_hash) VALUES (?, ?, ?, ?)",
-            (request.username, request.email, request.phone, password_hash)
-        )
-        conn.commit()
+        # Create user; a concurrent registration may have taken the name meanwhile
+        try:
+            cursor.execute(
+                "INSERT INTO users (username, email, phone, password_hash) VALUES (?, ?, ?, ?)",
+                (request.username, request.email, request.phone, password_hash)
+            )
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Roll back explicitly; the failed statement otherwise keeps the write lock
+            conn.rollback()
+            raise HTTPException(status_code=400, detail="Username already exists")
         user_id = cursor.lastrowid
-        
-        # Create session
-        token = create_session(user_id)
-        
-        return {
-            "message": "User registered successfully",
-            "token": token,
-            "username": request.username
-        }
+        refresh_leaderboards(cursor, user_id)
+    
+    # Create session
+    token = create_session(user_id)
+    
+    return {
+        "message": "User registered successfully",
+        "token": token,
+        "username": request.username
+    }
 
 @app.post("/login")
 async def login(request: LoginRequest):
@@ -368,20 +1570,29 @@ async def login(request: LoginRequest):
             "SELECT * FROM users WHERE username = ?",
             (request.username,)
         )
-        user = cursor.fetchone()
-        
-        if not user or dict(user)['password_hash'] != hash_password(request.password):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        
-        # Create session
-        token = create_session(dict(user)['id'])
-        
-        return {
-            "message": "Login successful",
-            "token": token,
-            "username": request.username,
-            "has_budget": dict(user)['monthly_budget'] > 0
-        }
+        row = cursor.fetchone()
+        user = dict(row) if row else None
+    
+    # Verify outside the DB context so no connection (or lock) is held meanwhile
+    if not user or not await run_password_job(verify_password, request.password, user['password_hash']):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    # Upgrade legacy or outdated hashes now that we know the password
+    if needs_rehash(user['password_hash']):
+        new_hash = await run_password_job(hash_password, request.password)
+        with get_db() as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user['id']))
+            conn.commit()
+    
+    # Create session
+    token = create_session(user['id'])
+    
+    return {
+        "message": "Login successful",
+        "token": token,
+        "username": request.username,
+        "has_budget": user['monthly_budget'] > 0
+    }
 
 @app.post("/logout")
 async def logout(token: str):
@@ -408,6 +1619,12 @@ async def set_budget(request: SetBudgetRequest, token: str):
         """, (request.monthly_budget, request.emergency_fund, request.emergency_pin, user['id']))
         conn.commit()
     
+    await broker.publish(user['id'], {
+        "type": "budget_updated",
+        "monthly_budget": request.monthly_budget,
+        "emergency_fund": request.emergency_fund
+    })
+    
     return {
         "message": "Budget updated",
         "monthly_budget": request.monthly_budget,
@@ -446,18 +1663,28 @@ async def add_transaction(request: AddTransactionRequest, token: str, emergency_
     # Add transaction
     with get_db() as conn:
         cursor = conn.cursor()
+        category = request.category or categorize(cursor, user['id'], request.description)
         cursor.execute("""
             INSERT INTO transactions (user_id, amount, description, category, is_verified)
             VALUES (?, ?, ?, ?, ?)
-        """, (user['id'], request.amount, request.description, request.category, 1 if request.is_verified else 0))
+        """, (user['id'], request.amount, request.description, category, 1 if request.is_verified else 0))
         conn.commit()
         txn_id = cursor.lastrowid
+        cursor.execute("SELECT * FROM transactions WHERE id = ?", (txn_id,))
+        txn = dict(cursor.fetchone())
     
     # Award coins and update streaks for verified transactions
     if request.is_verified:
         award_coins(user['id'], 1)
         update_streak_and_trees(user['id'])
     
+    await broker.publish(user['id'], {
+        "type": "transaction_added",
+        "transaction": {key: txn[key] for key in ("id", "amount", "description", "category", "is_useful", "is_verified", "timestamp")},
+        "current_spend": round(predicted_spend, 2),
+        **user_stats_event(user['id'])
+    })
+    
     return {
         "message": "Transaction added",
         "transaction_id": txn_id,
@@ -479,11 +1706,53 @@ async def mark_transaction(request: MarkTransactionRequest, token: str):
             WHERE id = ? AND user_id = ?
         """, (1 if request.is_useful else 0, request.transaction_id, user['id']))
         conn.commit()
+        marked = cursor.rowcount > 0
+    
+    if marked:
+        await broker.publish(user['id'], {
+            "type": "transaction_marked",
+            "transaction_id": request.transaction_id,
+            "is_useful": 1 if request.is_useful else 0
+        })
     
     return {"message": "Transaction marked"}
 
-@app.get("/dashboard")
-async def get_dashboard(token: str):
+@app.post("/set_category")
+async def set_category(request: SetCategoryRequest, token: str):
+    """Recategorize a transaction and remember the choice for similar descriptions"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    category = request.category.strip().lower()
+    if not category:
+        raise HTTPException(status_code=400, detail="Category is required")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT description, strftime('%Y-%m', timestamp), strftime('%Y-%m', timestamp) < strftime('%Y-%m', 'now')
+            FROM transactions WHERE id = ? AND user_id = ?
+        """, (request.transaction_id, user['id']))
+        txn = cursor.fetchone()
+        if not txn:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        
+        cursor.execute("UPDATE transactions SET category = ? WHERE id = ?", (category, request.transaction_id))
+        cursor.execute("""
+            INSERT INTO category_corrections (user_id, description_key, category)
+            VALUES (?, ?, ?)
+            ON CONFLICT (user_id, description_key) DO UPDATE SET category = excluded.category, updated_at = CURRENT_TIMESTAMP
+        """, (user['id'], " ".join(normalize_description(txn[0])), category))
+        if txn[2]:
+            # The month is closed, so its snapshot no longer matches the rows
+            save_month_snapshot(cursor, user['id'], txn[1], replace=True)
+        conn.commit()
+    
+    return {"message": "Category updated", "category": category}
+
+@app.get("/dashboard", response_model=DashboardResponse, response_model_exclude_unset=True)
+async def get_dashboard(token: str, heatmap_format: str = "list"):
     """Get user dashboard data"""
     user = get_user_from_token(token)
     if not user:
@@ -529,11 +1798,10 @@ async def get_dashboard(token: str):
                 "timestamp": txn['timestamp']
             })
             
-            # Add to chart data (cumulative)
+            # Add to chart data (cumulative); points reference transactions by index
             chart_data.append({
-                "timestamp": txn['timestamp'],
-                "amount": cumulative_spend,
-                "transaction_id": txn['id']
+                "txn": len(transactions) - 1,
+                "amount": cumulative_spend
             })
         
         # Calculate analytics
@@ -546,14 +1814,31 @@ async def get_dashboard(token: str):
         predicted_monthly = avg_daily * days_in_month
         
         # Get heatmap data (last 365 days)
-        cursor.execute("""
-            SELECT date, has_savings FROM streak_history
-            WHERE user_id = ?
-            AND date >= date('now', '-365 days')
-            ORDER BY date ASC
-        """, (user['id'],))
+        heatmap_bits = streak_window(cursor, user['id'], now.date(), HEATMAP_DAYS)
+        heatmap_start = now.date() - timedelta(days=HEATMAP_DAYS - 1)
+        
+        if heatmap_format == "bitmap":
+            # Compact encoding: base64 of the little-endian bitmap, bit 0 = start date
+            heatmap = {"heatmap_bitmap": {
+                "start": heatmap_start.isoformat(),
+                "days": HEATMAP_DAYS,
+                "bits": base64.b64encode(heatmap_bits.to_bytes(STREAK_BITMAP_BYTES, 'little')).decode()
+            }}
+        else:
+            heatmap = {"heatmap_data": [
+                {"date": (heatmap_start + timedelta(days=i)).isoformat(), "count": 1}
+                for i in iter_set_bits(heatmap_bits)
+            ]}
         
-        heatmap_data = [{"date": row[0], "count": row[1]} for row in cursor.fetchall()]
+        # Month-over-month trend: precomputed closed months + live current month
+        monthly_trend = get_monthly_history(cursor, user['id'])
+        monthly_trend.append({
+            "month": now.strftime('%Y-%m'),
+            "total_spend": cumulative_spend,
+            "txn_count": len(transactions),
+            "savings_days": (heatmap_bits >> (HEATMAP_DAYS - days_passed)).bit_count(),
+            "category_totals": category_totals
+        })
         
         budget_remaining = user['monthly_budget'] - cumulative_spend
         budget_usage = (cumulative_spend / user['monthly_budget'] * 100) if user['monthly_budget'] > 0 else 0
@@ -586,32 +1871,26 @@ async def get_dashboard(token: str):
                 "category_breakdown": [
                     {"category": cat, "amount": amt, "percentage": round((amt / cumulative_spend * 100) if cumulative_spend > 0 else 0, 1)}
                     for cat, amt in category_totals.items()
+                ],
+                "monthly_trend": [
+                    {
+                        "month": month['month'],
+                        "total_spend": round(month['total_spend'], 2),
+                        "txn_count": month['txn_count'],
+                        "savings_days": month['savings_days'],
+                        "category_totals": {cat: round(amt, 2) for cat, amt in month['category_totals'].items()}
+                    }
+                    for month in monthly_trend
                 ]
             },
             
             # Heatmap for streak visualization
-            "heatmap_data": heatmap_data
+            "heatmap_longest_run": longest_run(heatmap_bits),
+            **heatmap
         }
 
-@app.post("/simulate_payment")
-async def simulate_payment(request: SimulatePaymentRequest, token: str):
-    """Simulate payment with ML prediction"""
-    user = get_user_from_token(token)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    # Get current spend
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0) as total
-            FROM transactions
-            WHERE user_id = ?
-            AND strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')
-        """, (user['id'],))
-        current_spend = cursor.fetchone()[0]
-    
-    predicted_spend = current_spend + request.amount
+def classify_payment(user: dict, amount: float, predicted_spend: float):
+    """Decide SAFE/WARNING/BLOCKED for a payment that brings the month to predicted_spend"""
     budget_usage = (predicted_spend / user['monthly_budget'] * 100) if user['monthly_budget'] > 0 else 0
     
     # Calculate the safe spending limit (budget - emergency fund)
@@ -619,31 +1898,46 @@ async def simulate_payment(request: SimulatePaymentRequest, token: str):
     emergency_zone = predicted_spend > safe_limit
     overage = max(0, predicted_spend - user['monthly_budget'])
     
-    # Determine decision
     # If spending enters emergency zone (exceeds budget - emergency_fund), require PIN
     if emergency_zone and user['emergency_fund'] > 0:
-        if request.use_emergency:
-            if request.emergency_pin != user['emergency_pin']:
-                raise HTTPException(status_code=403, detail="Invalid emergency PIN")
-            decision = "SAFE"
-            reason = "Approved using emergency fund protection"
-            requires_pin = False
-        else:
-            decision = "BLOCKED"
-            reason = f"Emergency PIN required to approve ${request.amount:.2f} payment (over safe spending limit)."
-            requires_pin = True
+        return "BLOCKED", f"Emergency PIN required to approve ${amount:.2f} payment (over safe spending limit).", True, budget_usage
     elif budget_usage >= 100:
         # Exceeds budget completely with no emergency fund
-        decision = "BLOCKED"
-        reason = f"Predicted spending (${predicted_spend:.2f}) exceeds monthly budget by ${overage:.2f}"
-        requires_pin = False
+        return "BLOCKED", f"Predicted spending (${predicted_spend:.2f}) exceeds monthly budget by ${overage:.2f}", False, budget_usage
     elif budget_usage >= 85:
-        decision = "WARNING"
-        reason = f"This payment may push you to {budget_usage:.1f}% of budget"
-        requires_pin = False
+        return "WARNING", f"This payment may push you to {budget_usage:.1f}% of budget", False, budget_usage
     else:
+        return "SAFE", "Payment is within safe spending limits", False, budget_usage
+
+def get_month_spend(user_id: int) -> float:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(SUM(amount), 0) as total
+            FROM transactions
+            WHERE user_id = ?
+            AND strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')
+        """, (user_id,))
+        return cursor.fetchone()[0]
+
+@app.post("/simulate_payment")
+async def simulate_payment(request: SimulatePaymentRequest, token: str):
+    """Simulate payment with ML prediction"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Get current spend
+    current_spend = get_month_spend(user['id'])
+    predicted_spend = current_spend + request.amount
+    
+    # Determine decision
+    decision, reason, requires_pin, budget_usage = classify_payment(user, request.amount, predicted_spend)
+    if requires_pin and request.use_emergency:
+        if request.emergency_pin != user['emergency_pin']:
+            raise HTTPException(status_code=403, detail="Invalid emergency PIN")
         decision = "SAFE"
-        reason = "Payment is within safe spending limits"
+        reason = "Approved using emergency fund protection"
         requires_pin = False
     
     return {
@@ -657,6 +1951,68 @@ async def simulate_payment(request: SimulatePaymentRequest, token: str):
         "can_approve": decision == "SAFE"
     }
 
+MAX_SIMULATED_PAYMENTS = 500
+
+@app.post("/simulate_payments")
+async def simulate_payments(request: SimulatePaymentsRequest, token: str):
+    """Simulate a basket of payments against one read of this month's spend"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    if not request.payments:
+        raise HTTPException(status_code=400, detail="No payments to simulate")
+    if len(request.payments) > MAX_SIMULATED_PAYMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SIMULATED_PAYMENTS} payments per simulation")
+    
+    current_spend = get_month_spend(user['id'])
+    
+    # Payments with an explicit order go first (by order), the rest keep their position
+    sequence = sorted(
+        range(len(request.payments)),
+        key=lambda i: (request.payments[i].order is None, request.payments[i].order or 0, i)
+    )
+    amounts = [request.payments[i].amount for i in sequence]
+    if request.cumulative:
+        predicted = [current_spend + total for total in accumulate(amounts)]
+    else:
+        predicted = [current_spend + amount for amount in amounts]
+    
+    safe_limit = user['monthly_budget'] - user['emergency_fund']
+    results = []
+    first_emergency_index = None
+    first_blocked_index = None
+    
+    for i, amount, predicted_spend in zip(sequence, amounts, predicted):
+        decision, reason, requires_pin, budget_usage = classify_payment(user, amount, predicted_spend)
+        # Like classify_payment: with no emergency fund there is no emergency zone
+        if first_emergency_index is None and predicted_spend > safe_limit and user['emergency_fund'] > 0:
+            first_emergency_index = i
+        if first_blocked_index is None and decision == "BLOCKED":
+            first_blocked_index = i
+        
+        results.append({
+            "index": i,
+            "amount": amount,
+            "description": request.payments[i].description,
+            "decision": decision,
+            "predicted_spend": round(predicted_spend, 2),
+            "budget_remaining": round(user['monthly_budget'] - predicted_spend, 2),
+            "budget_usage_percent": round(budget_usage, 1),
+            "explanation": reason,
+            "requires_pin": requires_pin
+        })
+    
+    return {
+        "current_spend": round(current_spend, 2),
+        "total_amount": round(sum(amounts), 2),
+        "cumulative": request.cumulative,
+        "results": results,
+        # Indexes refer to positions in the request's payments list
+        "first_emergency_index": first_emergency_index,
+        "first_blocked_index": first_blocked_index
+    }
+
 @app.post("/check_scam")
 async def check_scam(request: ScamCheckRequest, token: str):
     """Check if a message is a scam using Gemini API"""
@@ -777,16 +2133,8 @@ async def get_scam_history(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
     
     with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM scam_checks
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 20
-        """, (user['id'],))
-        
         history = []
-        for row in cursor.fetchall():
+        for row in iter_history(conn, "scam_checks", user['id']):
             history.append({
                 "id": row[0],
                 "message_text": row[2][:100] + "..." if len(row[2]) > 100 else row[2],
@@ -795,6 +2143,8 @@ async def get_scam_history(token: str):
                 "explanation": row[5],
                 "timestamp": row[6]
             })
+            if len(history) == 20:
+                break
         
         return {"history": history}
 
@@ -825,6 +2175,9 @@ async def redeem_coins(request: RedeemCoinsRequest, token: str):
         """, (user['id'], request.brand, request.coins_required, redemption_code))
         
         conn.commit()
+        refresh_leaderboards(cursor, user['id'])
+    
+    await broker.publish(user['id'], {"type": "coins_updated", **user_stats_event(user['id'])})
     
     return {
         "message": "Coins redeemed successfully",
@@ -860,6 +2213,191 @@ async def get_redemption_history(token: str):
         
         return {"history": history}
 
+@app.get("/export")
+async def export_history(token: str, dataset: str = "transactions", export_format: str = Query("csv", alias="format")):
+    """Stream the user's full history (including archived months)"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    return export_response(dataset, export_format, user['id'], f"budgetguard-{dataset}")
+
+@app.get("/admin/export")
+async def admin_export(dataset: str = "transactions", export_format: str = Query("csv", alias="format"),
+                       authorization: Optional[str] = Header(None)):
+    """Stream every user's history (requires `Authorization: Bearer <ADMIN_TOKEN>`)"""
+    # A header, not a query parameter, so the secret stays out of access logs and history
+    scheme, _, admin_token = (authorization or "").partition(" ")
+    if not ADMIN_TOKEN or scheme.lower() != "bearer" or not hmac.compare_digest(admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return export_response(dataset, export_format, None, f"budgetguard-all-{dataset}")
+
+@app.get("/leaderboard")
+async def get_global_leaderboard(token: str, metric: str = "longest_streak", page: int = 1, page_size: int = 20):
+    """Get a page of the global leaderboard plus the caller's rank"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    board = get_leaderboard(metric)
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 100)
+    offset = (page - 1) * page_size
+    
+    entries = board.page(offset, page_size)
+    names = display_names_for([user_id for user_id, _ in entries])
+    
+    return {
+        "metric": metric,
+        "page": page,
+        "page_size": page_size,
+        "total": len(board),
+        "your_rank": board.rank(user['id']),
+        "your_score": user[metric],
+        "entries": [
+            # Users who haven't opted in are listed without a name
+            {"rank": offset + i + 1, "display_name": names.get(user_id), "score": score, "is_you": user_id == user['id']}
+            for i, (user_id, score) in enumerate(entries)
+        ]
+    }
+
+@app.get("/leaderboard/friends")
+async def get_friends_leaderboard(token: str, metric: str = "longest_streak"):
+    """Get the leaderboard among the caller and their friends"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    board = get_leaderboard(metric)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT friend_id FROM friendships WHERE user_id = ?", (user['id'],))
+        member_ids = [row[0] for row in cursor.fetchall()] + [user['id']]
+    
+    # Global ranks are already in order, so sorting by them orders the friends
+    ranked = sorted((board.rank(member_id) or len(board) + 1, member_id) for member_id in member_ids)
+    names = usernames_for(member_ids)
+    
+    return {
+        "metric": metric,
+        "entries": [
+            {
+                "rank": i + 1,
+                "global_rank": global_rank,
+                "username": names.get(member_id),
+                "score": board.scores.get(member_id, 0),
+                "is_you": member_id == user['id']
+            }
+            for i, (global_rank, member_id) in enumerate(ranked)
+        ]
+    }
+
+@app.post("/leaderboard/profile")
+async def set_leaderboard_profile(request: LeaderboardProfileRequest, token: str):
+    """Choose the name shown on the global leaderboard, or clear it to stay anonymous"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    display_name = (request.display_name or "").strip()
+    if len(display_name) > 32:
+        raise HTTPException(status_code=400, detail="Display name must be at most 32 characters")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if display_name:
+            cursor.execute("""
+                INSERT INTO leaderboard_profiles (user_id, display_name) VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET display_name = excluded.display_name
+            """, (user['id'], display_name))
+        else:
+            cursor.execute("DELETE FROM leaderboard_profiles WHERE user_id = ?", (user['id'],))
+        conn.commit()
+    
+    return {"message": "Leaderboard profile updated", "display_name": display_name or None}
+
+@app.post("/add_friend")
+async def add_friend(request: AddFriendRequest, token: str):
+    """Send a friend request by username (accepts theirs if they already asked)"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE username = ?", (request.username,))
+        friend = cursor.fetchone()
+        if not friend or friend[0] == user['id']:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        cursor.execute("SELECT 1 FROM friendships WHERE user_id = ? AND friend_id = ?", (user['id'], friend[0]))
+        if cursor.fetchone():
+            return {"message": "Already friends", "username": request.username}
+        
+        cursor.execute(
+            "SELECT 1 FROM friend_requests WHERE requester_id = ? AND addressee_id = ?",
+            (friend[0], user['id'])
+        )
+        if cursor.fetchone():
+            make_friends(cursor, user['id'], friend[0])
+            conn.commit()
+            return {"message": "Friend added", "username": request.username}
+        
+        cursor.execute(
+            "INSERT OR IGNORE INTO friend_requests (requester_id, addressee_id) VALUES (?, ?)",
+            (user['id'], friend[0])
+        )
+        conn.commit()
+    
+    return {"message": "Friend request sent", "username": request.username}
+
+@app.get("/friend_requests")
+async def get_friend_requests(token: str):
+    """List friend requests waiting for the caller's answer"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT u.username, r.created_at FROM friend_requests r
+            JOIN users u ON u.id = r.requester_id
+            WHERE r.addressee_id = ?
+            ORDER BY r.created_at DESC
+        """, (user['id'],))
+        return {"requests": [{"username": row[0], "created_at": row[1]} for row in cursor.fetchall()]}
+
+@app.post("/respond_friend")
+async def respond_friend(request: AddFriendRequest, token: str, accept: bool = True):
+    """Accept or decline a pending friend request"""
+    user = get_user_from_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT r.requester_id FROM friend_requests r
+            JOIN users u ON u.id = r.requester_id
+            WHERE u.username = ? AND r.addressee_id = ?
+        """, (request.username, user['id']))
+        pending = cursor.fetchone()
+        if not pending:
+            raise HTTPException(status_code=404, detail="No pending friend request from this user")
+        
+        if accept:
+            make_friends(cursor, user['id'], pending[0])
+        else:
+            cursor.execute(
+                "DELETE FROM friend_requests WHERE requester_id = ? AND addressee_id = ?",
+                (pending[0], user['id'])
+            )
+        conn.commit()
+    
+    return {"message": "Friend added" if accept else "Friend request declined", "username": request.username}
+
 @app.post("/upgrade_premium")
 async def upgrade_premium(token: str):
     """Upgrade user to premium"""
@@ -897,11 +2435,17 @@ async def ai_advisor(token: str):
             AND strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')
         """, (user['id'],))
         current_spend = cursor.fetchone()[0]
+        history = get_monthly_history(cursor, user['id'])
     
     savings_potential = user['monthly_budget'] - current_spend
+    avg_monthly_spend = (
+        sum(month['total_spend'] for month in history) / len(history) if history else current_spend
+    )
     
     advice = {
         "summary": "Based on your spending patterns, here are personalized recommendations:",
+        "avg_monthly_spend": round(avg_monthly_spend, 2),
+        "months_analyzed": len(history),
         "recommendations": [
             {
                 "type": "SIP",
@@ -927,13 +2471,46 @@ async def ai_advisor(token: str):
     
     return advice
 
+@app.websocket("/ws")
+async def live_updates(websocket: WebSocket, token: str):
+    """Stream this user's live update events"""
+    user = get_user_from_token(token)
+    if not user:
+        await websocket.close(code=1008)
+        return
+    
+    # Admission control only sees HTTP, so sockets are capped per user here
+    queue = broker.subscribe(user['id'])
+    if queue is None:
+        await websocket.close(code=1013)  # Try again later; the client polls meanwhile
+        return
+    
+    async def forward_events():
+        while True:
+            await websocket.send_json(await queue.get())
+    
+    sender = None
+    try:
+        await websocket.accept()
+        sender = asyncio.create_task(forward_events())
+        # Nothing is expected from the client; this just waits for the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender:
+            sender.cancel()
+        broker.unsubscribe(user['id'], queue)
+
 @app.get("/")
 async def root():
     return {
         "app": "BudgetGuard API v2",
         "version": "2.0",
         "features": ["SQLite Database", "User Authentication", "Transaction Marking"],
-        "endpoints": ["/register", "/login", "/logout", "/set_budget", "/add_transaction", "/mark_transaction", "/dashboard", "/simulate_payment"]
+        "storage": memory_db_status() if memory_conn else {"mode": "file"},
+        "endpoints": ["/register", "/login", "/logout", "/set_budget", "/add_transaction", "/mark_transaction", "/dashboard", "/simulate_payment", "/simulate_payments"]
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import importlib
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def load_app(tmp_path, monkeypatch):
+    """Import a fresh copy of main in a scratch directory seeded with budgetguard.db"""
+    def load(prepare=None, **env):
+        shutil.copy2(os.path.join(BACKEND_DIR, "budgetguard.db"), tmp_path / "budgetguard.db")
+        if prepare:
+            # Lets a test shape the DB as an older deployment would have left it
+            conn = sqlite3.connect(tmp_path / "budgetguard.db")
+            prepare(conn)
+            conn.commit()
+            conn.close()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("RATE_LIMIT_ENABLED", "0")
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        monkeypatch.syspath_prepend(BACKEND_DIR)
+        sys.modules.pop("main", None)
+        return importlib.import_module("main")
+
+    yield load
+    sys.modules.pop("main", None)
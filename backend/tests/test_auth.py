@@ -0,0 +1,38 @@
+import asyncio
+import hashlib
+import sqlite3
+
+import httpx
+
+
+def test_concurrent_registrations_for_one_username(load_app):
+    main = load_app()
+
+    async def register_many():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/register", json={"username": "racer", "password": "pw"}) for _ in range(3)
+            ])
+
+    codes = sorted(response.status_code for response in asyncio.run(register_many()))
+    assert codes == [200, 400, 400]
+
+
+def test_legacy_hash_is_upgraded_on_login(load_app):
+    main = load_app()
+    conn = sqlite3.connect(main.DB_PATH)
+    conn.execute(
+        "INSERT INTO users (username, password_hash) VALUES ('legacy', ?)",
+        (hashlib.sha256(b"old").hexdigest(),)
+    )
+    conn.commit()
+
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    assert client.post("/login", json={"username": "legacy", "password": "wrong"}).status_code == 401
+    assert client.post("/login", json={"username": "legacy", "password": "old"}).status_code == 200
+
+    stored = conn.execute("SELECT password_hash FROM users WHERE username = 'legacy'").fetchone()[0]
+    assert stored.startswith("scrypt$")
+    assert client.post("/login", json={"username": "legacy", "password": "old"}).status_code == 200
@@ -0,0 +1,86 @@
+import json
+
+from fastapi.testclient import TestClient
+
+
+def register(client, username):
+    return client.post("/register", json={"username": username, "password": "pw"}).json()["token"]
+
+
+def test_only_uncategorized_rows_are_rescanned(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    token = register(client, "tagger")
+    client.post("/set_budget", params={"token": token}, json={"monthly_budget": 10000, "emergency_fund": 0})
+
+    def add(description, category=None):
+        body = {"amount": 5, "description": description}
+        if category:
+            body["category"] = category
+        return client.post("/add_transaction", params={"token": token}, json=body).json()["transaction_id"]
+
+    unmatched = add("Transfer to Rahul")
+    explicit = add("Uber ride", "general")
+    inferred = add("Uber ride")
+
+    with main.get_db() as conn:
+        categories = dict(conn.execute("SELECT id, category FROM transactions WHERE id IN (?, ?, ?)",
+                                       (unmatched, explicit, inferred)).fetchall())
+        assert categories == {unmatched: None, explicit: "general", inferred: "transport"}
+        conn.execute("UPDATE transactions SET description = 'Uber to airport' WHERE id = ?", (unmatched,))
+        conn.commit()
+
+    assert main.categorize_uncategorized() == 1
+    with main.get_db() as conn:
+        assert conn.execute("SELECT category FROM transactions WHERE id = ?", (unmatched,)).fetchone()[0] == "transport"
+        assert conn.execute("SELECT category FROM transactions WHERE id = ?", (explicit,)).fetchone()[0] == "general"
+
+
+def test_correction_in_closed_month_refreshes_snapshot(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    token = register(client, "corrector")
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'corrector'").fetchone()[0]
+        txn_id = conn.execute("""
+            INSERT INTO transactions (user_id, amount, description, category, timestamp)
+            VALUES (?, 40, 'Dinner in Goa', 'food', datetime('now', 'start of month', '-1 month'))
+        """, (user_id,)).lastrowid
+        conn.commit()
+    main.precompute_snapshots()
+
+    response = client.post("/set_category", params={"token": token}, json={"transaction_id": txn_id, "category": "Travel"})
+    assert response.status_code == 200
+
+    with main.get_db() as conn:
+        totals = conn.execute("SELECT category_totals FROM analytics_snapshots WHERE user_id = ?", (user_id,)).fetchone()[0]
+    assert json.loads(totals) == {"travel": 40}
+
+
+def test_nightly_categorization_refreshes_closed_month_snapshot(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    token = register(client, "roaster")
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'roaster'").fetchone()[0]
+        ids = [conn.execute("""
+            INSERT INTO transactions (user_id, amount, description, category, timestamp)
+            VALUES (?, ?, 'Blue Tokai beans', NULL, datetime('now', 'start of month', '-1 month'))
+        """, (user_id, amount)).lastrowid for amount in (30, 20)]
+        conn.commit()
+    main.precompute_snapshots()
+
+    client.post("/set_category", params={"token": token}, json={"transaction_id": ids[0], "category": "food"})
+    assert main.categorize_uncategorized() == 1
+
+    with main.get_db() as conn:
+        totals = conn.execute("SELECT category_totals FROM analytics_snapshots WHERE user_id = ?", (user_id,)).fetchone()[0]
+    assert json.loads(totals) == {"food": 50}
+
+
+def test_plural_and_singular_normalize_alike(load_app):
+    main = load_app()
+    for plural, singular in [("groceries", "grocery"), ("buses", "bus"), ("classes", "class"),
+                             ("movies", "movie"), ("tickets", "ticket"), ("lunches", "lunch"), ("fees", "fee")]:
+        assert main.normalize_description(plural) == main.normalize_description(singular)
+    assert main.match_category(main.normalize_description("Instamart groceries order")) == "groceries"
@@ -0,0 +1,68 @@
+import asyncio
+import csv
+import io
+
+from fastapi.testclient import TestClient
+
+
+def test_export_pages_hot_rows_then_archives_without_holding_the_db(load_app):
+    main = load_app(MEMORY_DB=1, CHECKPOINT_DIR="durable")
+    main.EXPORT_BATCH_ROWS = 3
+    client = TestClient(main.app)
+    token = client.post("/register", json={"username": "exporter", "password": "pw"}).json()["token"]
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'exporter'").fetchone()[0]
+        # Same timestamp for the hot rows, so paging has to break ties by id
+        for i in range(7):
+            conn.execute("""
+                INSERT INTO transactions (user_id, amount, description, timestamp)
+                VALUES (?, ?, 'hot', '2099-01-01 00:00:00')
+            """, (user_id, i))
+        conn.execute("""
+            INSERT INTO transactions (user_id, amount, description, timestamp)
+            VALUES (?, 100, 'archived', datetime('now', '-1 year'))
+        """, (user_id,))
+        conn.commit()
+    main.archive_closed_months()
+
+    def lock_is_free():
+        # memory_lock is re-entrant, so probe it from another thread
+        if main.memory_lock.acquire(blocking=False):
+            main.memory_lock.release()
+            return True
+        return False
+
+    async def export_checking_lock():
+        body = []
+        async for chunk in main.stream_export("transactions", user_id, "csv"):
+            assert await asyncio.to_thread(lock_is_free)
+            body.append(chunk)
+        return b"".join(body)
+
+    rows = list(csv.DictReader(io.StringIO(asyncio.run(export_checking_lock()).decode())))
+    assert [float(row["amount"]) for row in rows] == [6, 5, 4, 3, 2, 1, 0, 100]
+
+    response = client.get("/export", params={"token": token, "dataset": "transactions", "format": "ndjson"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 8
+
+
+def test_export_pages_use_an_index(load_app):
+    main = load_app()
+    page = "SELECT * FROM {table} {where} ORDER BY timestamp DESC, id DESC LIMIT 1000"
+    with main.get_db() as conn:
+        for table in main.EXPORT_DATASETS.values():
+            for where, params in (("WHERE (timestamp, id) < (?, ?)", ("2099", 1)),
+                                  ("WHERE user_id = ? AND (timestamp, id) < (?, ?)", (1, "2099", 1))):
+                plan = " ".join(row[3] for row in conn.execute(
+                    "EXPLAIN QUERY PLAN " + page.format(table=table, where=where), params))
+                assert "TEMP B-TREE" not in plan and "INDEX" in plan, (table, plan)
+
+
+def test_admin_export_takes_the_token_from_a_header(load_app):
+    main = load_app(ADMIN_TOKEN="s3cret")
+    client = TestClient(main.app)
+
+    assert client.get("/admin/export", params={"admin_token": "s3cret"}).status_code == 403
+    assert client.get("/admin/export", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.get("/admin/export", headers={"Authorization": "Bearer s3cret"}).status_code == 200
@@ -0,0 +1,40 @@
+import os
+
+from fastapi.testclient import TestClient
+
+
+def test_missing_archive_is_skipped(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    token = client.post("/register", json={"username": "historian", "password": "pw"}).json()["token"]
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'historian'").fetchone()[0]
+        for age in ("-1 year", "-13 months"):
+            conn.execute("""
+                INSERT INTO scam_checks (user_id, message_text, risk_score, risk_level, explanation, timestamp)
+                VALUES (?, ?, 0.1, 'low', 'archived', datetime('now', ?))
+            """, (user_id, f"old {age}", age))
+        conn.execute("""
+            INSERT INTO scam_checks (user_id, message_text, risk_score, risk_level, explanation)
+            VALUES (?, 'recent', 0.1, 'low', 'hot')
+        """, (user_id,))
+        conn.commit()
+
+    assert main.archive_closed_months() >= 2
+    with main.get_db() as conn:
+        lost_month = conn.execute("SELECT strftime('%Y-%m', 'now', '-1 year')").fetchone()[0]
+    os.remove(main.archive_path(lost_month))
+
+    response = client.get("/scam_history", params={"token": token})
+    assert response.status_code == 200
+    assert [item["message_text"] for item in response.json()["history"]] == ["recent", "old -13 months"]
+
+
+def test_hot_tables_are_indexed_by_user_and_time(load_app):
+    main = load_app()
+    with main.get_db() as conn:
+        for table in main.ARCHIVED_TABLES:
+            plan = conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT * FROM {table} WHERE user_id = 1 ORDER BY timestamp DESC"
+            ).fetchall()
+            assert any(f"idx_{table}_user_time" in row[3] for row in plan)
@@ -0,0 +1,122 @@
+from fastapi.testclient import TestClient
+
+
+def register(client, username):
+    return client.post("/register", json={"username": username, "password": "pw"}).json()["token"]
+
+
+def friends_board(client, token):
+    response = client.get("/leaderboard/friends", params={"token": token, "metric": "coin_balance"})
+    return [entry["username"] for entry in response.json()["entries"]]
+
+
+def test_friendship_needs_the_other_users_consent(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    alice, bob, carol = (register(client, name) for name in ("alice", "bob", "carol"))
+
+    assert client.post("/add_friend", params={"token": alice}, json={"username": "bob"}).json()["message"] == "Friend request sent"
+    assert friends_board(client, alice) == ["alice"]
+    assert friends_board(client, bob) == ["bob"]
+    assert client.get("/friend_requests", params={"token": bob}).json()["requests"][0]["username"] == "alice"
+
+    response = client.post("/respond_friend", params={"token": bob}, json={"username": "alice"})
+    assert response.json()["message"] == "Friend added"
+    assert sorted(friends_board(client, alice)) == ["alice", "bob"]
+    assert client.get("/friend_requests", params={"token": bob}).json()["requests"] == []
+
+    # Declined requests never become friendships; a mutual request does
+    client.post("/add_friend", params={"token": carol}, json={"username": "alice"})
+    client.post("/respond_friend", params={"token": alice, "accept": False}, json={"username": "carol"})
+    assert "carol" not in friends_board(client, alice)
+    assert client.post("/respond_friend", params={"token": alice}, json={"username": "carol"}).status_code == 404
+
+    client.post("/add_friend", params={"token": carol}, json={"username": "bob"})
+    assert client.post("/add_friend", params={"token": bob}, json={"username": "carol"}).json()["message"] == "Friend added"
+    assert "bob" in friends_board(client, carol)
+
+
+def test_global_board_shows_only_opted_in_names(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    shy, proud = register(client, "shy-login"), register(client, "proud-login")
+    client.post("/leaderboard/profile", params={"token": proud}, json={"display_name": " Proud Saver "})
+
+    response = client.get("/leaderboard", params={"token": shy, "page_size": 100})
+    entries = response.json()["entries"]
+    assert all("username" not in entry for entry in entries)
+    names = {entry["display_name"] for entry in entries}
+    assert "Proud Saver" in names
+    assert not names & {"shy-login", "proud-login"}
+    assert [entry["display_name"] for entry in entries if entry["is_you"]] == [None]
+
+    client.post("/leaderboard/profile", params={"token": proud}, json={"display_name": ""})
+    entries = client.get("/leaderboard", params={"token": shy, "page_size": 100}).json()["entries"]
+    assert "Proud Saver" not in {entry["display_name"] for entry in entries}
+
+
+def seed_board(main, scores):
+    """Replace every user with ids 1..n holding the given coin balances"""
+    with main.get_db() as conn:
+        conn.execute("DELETE FROM users")
+        conn.executemany(
+            "INSERT INTO users (id, username, password_hash, coin_balance) VALUES (?, ?, 'x', ?)",
+            [(user_id, f"user{user_id}", score) for user_id, score in enumerate(scores, 1)]
+        )
+        conn.commit()
+    return main.Leaderboard("coin_balance")
+
+
+def test_rank_and_page_break_ties_by_user_id(load_app):
+    main = load_app()
+    board = seed_board(main, [10, 30, 30, 0, 20])
+
+    assert len(board) == 5
+    assert [board.rank(user_id) for user_id in range(1, 6)] == [4, 1, 2, 5, 3]
+    assert board.page(0, 2) == [(2, 30), (3, 30)]
+    assert board.page(1, 2) == [(3, 30), (5, 20)]
+    assert board.page(4, 10) == [(4, 0)]
+    assert board.page(10, 10) == []
+    assert board.rank(99) is None
+
+
+def test_updates_move_users_and_keep_ties_ordered(load_app):
+    main = load_app()
+    board = seed_board(main, [10, 30, 30, 0, 20])
+    board.update(1, 99)  # ignored until the board is loaded from the DB
+    assert board.rank(1) == 4
+
+    board.update(4, 30)
+    assert board.page(0, 3) == [(2, 30), (3, 30), (4, 30)]
+    board.update(2, 5)
+    assert [user_id for user_id, _ in board.page(0, 5)] == [3, 4, 5, 1, 2]
+    board.update(6, 25)  # a user registered after the load
+    assert board.rank(6) == 3 and len(board) == 6
+    board.update(6, 25)
+    assert len(board) == 6
+
+
+def test_scores_follow_transactions_and_order_the_friends_board(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    alice, bob = register(client, "alice"), register(client, "bob")
+    client.post("/add_friend", params={"token": alice}, json={"username": "bob"})
+    client.post("/respond_friend", params={"token": bob}, json={"username": "alice"})
+
+    def board(token):
+        return client.get("/leaderboard/friends", params={"token": token, "metric": "coin_balance"}).json()["entries"]
+
+    # Both start at 0 coins, so the older account (alice) wins the tie
+    assert [entry["username"] for entry in board(bob)] == ["alice", "bob"]
+
+    client.post("/set_budget", params={"token": bob}, json={"monthly_budget": 1000, "emergency_fund": 0})
+    client.post("/add_transaction", params={"token": bob}, json={"amount": 5, "description": "Coffee"})
+
+    entries = board(bob)
+    assert [(entry["username"], entry["score"], entry["is_you"]) for entry in entries] == [
+        ("bob", 1, True), ("alice", 0, False)
+    ]
+    assert entries[0]["global_rank"] < entries[1]["global_rank"]
+    response = client.get("/leaderboard", params={"token": bob, "metric": "coin_balance"}).json()
+    assert response["your_rank"] == entries[0]["global_rank"]
+    assert response["your_score"] == 1
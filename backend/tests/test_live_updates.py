@@ -0,0 +1,53 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+def wait_until(condition, timeout=2.0):
+    """The server notices a closed socket a moment after the client closes it"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_writes_publish_deltas_to_the_users_socket(load_app):
+    main = load_app()
+    # One client context keeps requests and the socket on the same event loop
+    with TestClient(main.app) as client:
+        token = client.post("/register", json={"username": "watcher", "password": "pw"}).json()["token"]
+        other = client.post("/register", json={"username": "bystander", "password": "pw"}).json()["token"]
+
+        with client.websocket_connect(f"/ws?token={token}") as socket:
+            client.post("/set_budget", params={"token": token}, json={"monthly_budget": 500, "emergency_fund": 50})
+            assert socket.receive_json() == {"type": "budget_updated", "monthly_budget": 500, "emergency_fund": 50}
+
+            # Another user's writes never reach this socket
+            client.post("/set_budget", params={"token": other}, json={"monthly_budget": 1, "emergency_fund": 0})
+            client.post("/add_transaction", params={"token": token}, json={"amount": 12.5, "description": "Uber ride"})
+            event = socket.receive_json()
+            assert event["type"] == "transaction_added"
+            assert event["transaction"]["amount"] == 12.5
+            assert event["transaction"]["category"] == "transport"
+            assert event["current_spend"] == 12.5
+            assert event["coin_balance"] == 1
+
+        wait_until(lambda: main.broker.subscribers == {})
+
+
+def test_sockets_per_user_are_capped(load_app):
+    main = load_app(MAX_SOCKETS_PER_USER=2)
+    with TestClient(main.app) as client:
+        token = client.post("/register", json={"username": "tabs", "password": "pw"}).json()["token"]
+        with client.websocket_connect(f"/ws?token={token}"), client.websocket_connect(f"/ws?token={token}"):
+            with pytest.raises(WebSocketDisconnect) as refused:
+                with client.websocket_connect(f"/ws?token={token}"):
+                    pass
+            assert refused.value.code == 1013
+
+        # Closed sockets free their slots
+        wait_until(lambda: main.broker.subscribers == {})
+        with client.websocket_connect(f"/ws?token={token}"):
+            pass
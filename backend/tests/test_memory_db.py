@@ -0,0 +1,87 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+from fastapi.testclient import TestClient
+
+
+def test_archived_history_survives_restart(load_app, tmp_path):
+    durable = tmp_path / "durable"
+    main = load_app(MEMORY_DB=1, CHECKPOINT_DIR=durable)
+    assert main.ARCHIVE_DIR == str(durable / "archive")
+
+    client = TestClient(main.app)
+    token = client.post("/register", json={"username": "keeper", "password": "pw"}).json()["token"]
+    with main.get_db() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'keeper'").fetchone()[0]
+        conn.execute("""
+            INSERT INTO scam_checks (user_id, message_text, risk_score, risk_level, explanation, timestamp)
+            VALUES (?, 'old message', 0.9, 'high', 'archived', datetime('now', '-1 year'))
+        """, (user_id,))
+        conn.commit()
+
+    assert main.archive_closed_months() >= 1
+    assert os.listdir(durable / "archive")
+
+    # A new instance keeps only the durable store; the scratch dir is gone
+    for name in os.listdir(tmp_path):
+        if name != "durable":
+            path = tmp_path / name
+            shutil.rmtree(path) if path.is_dir() else path.unlink()
+    main = load_app(MEMORY_DB=1, CHECKPOINT_DIR=durable)
+
+    response = TestClient(main.app).get("/scam_history", params={"token": token})
+    assert response.status_code == 200
+    assert [item["message_text"] for item in response.json()["history"]] == ["old message"]
+
+
+def test_checkpoint_holds_the_db_only_while_copying(load_app, tmp_path):
+    durable = tmp_path / "durable"
+    main = load_app(MEMORY_DB=1, CHECKPOINT_DIR=durable)
+    with main.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO scam_checks (user_id, message_text) VALUES (1, ?)",
+            [("x" * 500,) for _ in range(2000)]
+        )
+        conn.commit()
+
+    writes_during_checkpoint = 0
+    checkpointer = threading.Thread(target=main.checkpoint_memory_db)
+    checkpointer.start()
+    while checkpointer.is_alive():
+        with main.get_db() as conn:
+            conn.execute("INSERT INTO scam_checks (user_id, message_text) VALUES (1, 'during')")
+            conn.commit()
+        writes_during_checkpoint += 1
+    checkpointer.join()
+
+    status = main.memory_db_status()
+    assert 0 < status["last_checkpoint_stall_ms"] < status["last_checkpoint_ms"]
+
+    # Whatever the copy missed is still pending, and the next checkpoint catches up
+    main.checkpoint_memory_db()
+    with main.get_db() as conn:
+        expected = conn.execute("SELECT COUNT(*) FROM scam_checks").fetchone()[0]
+    saved = sqlite3.connect(durable / "budgetguard.db")
+    assert saved.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert saved.execute("SELECT COUNT(*) FROM scam_checks").fetchone()[0] == expected
+
+
+def test_unsaved_window_starts_at_the_first_unsaved_write(load_app, tmp_path, monkeypatch):
+    main = load_app(MEMORY_DB=1, CHECKPOINT_DIR=tmp_path / "durable")
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: clock[0])
+    main.checkpoint_memory_db()
+    assert main.memory_db_status()["unsaved_seconds"] == 0
+
+    # An hour idle, then one write: the window is how long that write has waited
+    clock[0] += 3600
+    with main.get_db() as conn:
+        conn.execute("INSERT INTO scam_checks (user_id, message_text) VALUES (1, 'late')")
+        conn.commit()
+    clock[0] += 5
+    assert main.memory_db_status()["unsaved_seconds"] == 5
+
+    main.checkpoint_memory_db()
+    assert main.memory_db_status()["unsaved_seconds"] == 0
@@ -0,0 +1,29 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+
+def test_store_evicts_least_recently_used(load_app):
+    main = load_app()
+    store = main.InProcessRateLimitStore()
+    store.MAX_BUCKETS = 3
+
+    async def run():
+        await store.take("a", 1, 1)
+        for key in ("b", "c", "a", "d"):
+            await store.take(key, 1, 5)
+
+    asyncio.run(run())
+    assert list(store.buckets) == ["c", "a", "d"]
+    assert len(store.buckets) == 3
+
+
+def test_random_tokens_are_limited_per_ip(load_app):
+    main = load_app(RATE_LIMIT_ENABLED=1)
+    main.RATE_LIMITS["read"] = (0.001, 2)
+    client = TestClient(main.app)
+
+    codes = [client.get("/", params={"token": f"random-{i}"}).status_code for i in range(20)]
+    assert codes.count(200) == 2 * main.IP_LIMIT_MULTIPLIER
+    # Rejected requests never reach the token bucket, so they add no keys
+    assert len(main.rate_limit_store.buckets) == 1 + 2 * main.IP_LIMIT_MULTIPLIER
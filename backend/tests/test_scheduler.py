@@ -0,0 +1,37 @@
+import asyncio
+
+
+def run_scheduler_briefly(main, monkeypatch):
+    """Run nightly_scheduler until it goes to sleep for the off-peak window; return the jobs it ran"""
+    ran = []
+    for job in ("categorize_uncategorized", "precompute_snapshots", "archive_closed_months"):
+        monkeypatch.setattr(main, job, lambda job=job: ran.append(job) or 0)
+
+    async def run():
+        try:
+            await asyncio.wait_for(main.nightly_scheduler(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    return ran
+
+
+def test_startup_only_catches_up_snapshots_when_overdue(load_app, monkeypatch):
+    main = load_app()
+    assert run_scheduler_briefly(main, monkeypatch) == ["precompute_snapshots"]
+
+    assert main.claim_job_run("nightly", "-20 hours")
+    assert run_scheduler_briefly(main, monkeypatch) == []
+
+
+def test_only_one_worker_claims_a_nightly_run(load_app):
+    main = load_app()
+    assert main.claim_job_run("nightly", "-20 hours")
+    assert not main.claim_job_run("nightly", "-20 hours")
+
+    with main.get_db() as conn:
+        conn.execute("UPDATE job_runs SET last_run_at = datetime('now', '-21 hours') WHERE name = 'nightly'")
+        conn.commit()
+    assert main.job_ran_within("nightly", "-1 day")
+    assert main.claim_job_run("nightly", "-20 hours")
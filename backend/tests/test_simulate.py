@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+
+def simulate(client, token, budget, emergency_fund, amounts):
+    client.post("/set_budget", params={"token": token},
+                json={"monthly_budget": budget, "emergency_fund": emergency_fund, "emergency_pin": "1234"})
+    response = client.post("/simulate_payments", params={"token": token},
+                           json={"payments": [{"amount": amount} for amount in amounts]})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_first_emergency_index(load_app):
+    main = load_app()
+    client = TestClient(main.app)
+    token = client.post("/register", json={"username": "planner", "password": "pw"}).json()["token"]
+
+    assert simulate(client, token, 1000, 200, [500, 400, 50])["first_emergency_index"] == 1
+    assert simulate(client, token, 1000, 0, [500, 400, 500])["first_emergency_index"] is None
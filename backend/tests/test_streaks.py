@@ -0,0 +1,79 @@
+import random
+from datetime import date, timedelta
+
+
+def naive_current_streak(days: set, today: date) -> int:
+    run = 0
+    while today - timedelta(days=run) in days:
+        run += 1
+    return run
+
+
+def naive_longest_streak(days: set) -> int:
+    return max((naive_current_streak(days, day) for day in days), default=0)
+
+
+def test_window_spans_year_boundaries(load_app):
+    main = load_app()
+    with main.get_db() as conn:
+        cursor = conn.cursor()
+        for day in (date(2024, 12, 31), date(2025, 1, 1), date(2025, 12, 30), date(2025, 12, 31),
+                    date(2026, 1, 1), date(2026, 1, 2)):
+            main.set_streak_day(cursor, 999, day, True)
+        main.set_streak_day(cursor, 999, date(2025, 12, 30), False)
+
+        # Oldest day is bit 0: Dec 29 .. Jan 2
+        assert main.streak_window(cursor, 999, date(2026, 1, 2), 5) == 0b11100
+        assert main.trailing_run(0b11100, 5) == 3
+        # Leap-year Dec 31 is bit 365 and still joins Jan 1 of the next year
+        assert main.streak_window(cursor, 999, date(2025, 1, 1), 2) == 0b11
+        assert main.current_streak_length(cursor, 999, date(2026, 1, 2)) == 3
+
+
+def test_bit_helpers_match_a_naive_count(load_app):
+    main = load_app()
+    rng = random.Random(27)
+    today = date(2026, 3, 1)
+    with main.get_db() as conn:
+        cursor = conn.cursor()
+        for user_id in range(1000, 1020):
+            density = rng.random()
+            days = {today - timedelta(days=offset) for offset in range(900) if rng.random() < density}
+            for day in days:
+                main.set_streak_day(cursor, user_id, day, True)
+
+            assert main.current_streak_length(cursor, user_id, today) == naive_current_streak(days, today)
+            window = main.streak_window(cursor, user_id, today, 900)
+            assert main.longest_run(window) == naive_longest_streak(days)
+            assert {today - timedelta(days=899 - bit) for bit in main.iter_set_bits(window)} == days
+
+
+def test_legacy_streak_history_survives_migration_as_bits(load_app):
+    legacy = [(1, "2025-12-31", 1), (1, "2026-01-01", 1), (1, "2026-01-02", 0), (2, "2024-12-31", 1)]
+
+    def prepare(conn):
+        # A bitmap written by a newer instance before this DB was migrated
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS streak_bitmaps (
+                user_id INTEGER NOT NULL, year INTEGER NOT NULL, bits BLOB NOT NULL,
+                PRIMARY KEY (user_id, year)
+            )
+        """)
+        conn.execute("INSERT INTO streak_bitmaps VALUES (1, 2026, ?)", ((1 << 9).to_bytes(46, "little"),))
+        conn.execute("DELETE FROM streak_history WHERE user_id IN (1, 2)")
+        conn.executemany("INSERT INTO streak_history (user_id, date, has_savings) VALUES (?, ?, ?)", legacy)
+
+    main = load_app(prepare=prepare)
+    with main.get_db() as conn:
+        cursor = conn.cursor()
+        expected = conn.execute("SELECT user_id, date FROM streak_history_migrated WHERE has_savings = 1").fetchall()
+        assert len(expected) >= 3
+        for user_id, day in expected:
+            day = date.fromisoformat(day)
+            assert main.load_streak_bits(cursor, user_id, day.year) >> (day.timetuple().tm_yday - 1) & 1
+
+        assert main.load_streak_bits(cursor, 1, 2026) == 0b1000000001  # Jan 1 migrated, Jan 10 kept, Jan 2 unset
+        assert main.load_streak_bits(cursor, 2, 2024) == 1 << 365
+        assert main.current_streak_length(cursor, 1, date(2026, 1, 1)) == 2
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "streak_history" not in tables
@@ -9,6 +9,7 @@ import Activity from './pages/Activity';
 import Rewards from './pages/Rewards';
 import Premium from './pages/Premium';
 import Security from './pages/Security';
+import { fetchWithRetry } from './api';
 import './index.css';
 
 const API_URL = import.meta.env.VITE_API_URL || '/api';
@@ -30,17 +31,23 @@ function App() {
 
   const checkBudgetStatus = async () => {
     try {
-      const response = await fetch(`${API_URL}/dashboard?token=${token}`);
-      if (!response.ok) {
+      const response = await fetchWithRetry(`${API_URL}/dashboard?token=${token}`);
+      if (response.status === 401) {
         // Invalid token
         handleLogout();
         return;
       }
+      if (!response.ok) {
+        // Rate limited or server trouble: stay signed in, the dashboard retries on its own
+        console.error('Failed to check budget status:', response.status);
+        setIsSetup(true);
+        return;
+      }
       const data = await response.json();
       setIsSetup(data.monthly_budget > 0);
     } catch (error) {
       console.error('Failed to check budget status:', error);
-      handleLogout();
+      setIsSetup(true);
     } finally {
       setLoading(false);
     }
@@ -0,0 +1,11 @@
+// Retry requests the server rate-limited (429), waiting as long as Retry-After asks
+export async function fetchWithRetry(url, options, attempts = 3) {
+  for (let attempt = 1; ; attempt++) {
+    const response = await fetch(url, options);
+    if (response.status !== 429 || attempt >= attempts) {
+      return response;
+    }
+    const seconds = Number(response.headers.get('Retry-After')) || attempt;
+    await new Promise(resolve => setTimeout(resolve, seconds * 1000));
+  }
+}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Outlet, useLocation } from 'react-router-dom';
 import {
@@ -9,9 +9,72 @@ import {
     AlertTriangle
 } from 'lucide-react';
 import Navbar from './Navbar';
+import { fetchWithRetry } from '../api';
 
 const API_URL = import.meta.env.VITE_API_URL || '/api';
 
+// Apply a live update event from the server to the dashboard payload
+const applyLiveUpdate = (data, event) => {
+    const stats = {
+        coin_balance: event.coin_balance ?? data.coin_balance,
+        current_streak: event.current_streak ?? data.current_streak,
+        longest_streak: event.longest_streak ?? data.longest_streak,
+        tree_progress: event.tree_progress ?? data.tree_progress,
+        total_trees_planted: event.total_trees_planted ?? data.total_trees_planted
+    };
+
+    switch (event.type) {
+        case 'transaction_added': {
+            const txn = event.transaction;
+            const category = txn.category || 'general';
+            const totals = {};
+            data.analytics.category_breakdown.forEach(c => { totals[c.category] = c.amount; });
+            totals[category] = (totals[category] || 0) + txn.amount;
+
+            return {
+                ...data,
+                ...stats,
+                current_spend: event.current_spend,
+                budget_remaining: Math.round((data.monthly_budget - event.current_spend) * 100) / 100,
+                budget_usage_percent: data.monthly_budget > 0
+                    ? Math.round(event.current_spend / data.monthly_budget * 1000) / 10
+                    : 0,
+                transactions: [...data.transactions, txn],
+                chart_data: [...data.chart_data, { txn: data.transactions.length, amount: event.current_spend }],
+                analytics: {
+                    ...data.analytics,
+                    category_breakdown: Object.entries(totals).map(([cat, amount]) => ({
+                        category: cat,
+                        amount,
+                        percentage: event.current_spend > 0 ? Math.round(amount / event.current_spend * 1000) / 10 : 0
+                    }))
+                }
+            };
+        }
+        case 'transaction_marked':
+            return {
+                ...data,
+                transactions: data.transactions.map(t =>
+                    t.id === event.transaction_id ? { ...t, is_useful: event.is_useful } : t
+                )
+            };
+        case 'budget_updated':
+            return {
+                ...data,
+                monthly_budget: event.monthly_budget,
+                emergency_fund: event.emergency_fund,
+                budget_remaining: Math.round((event.monthly_budget - data.current_spend) * 100) / 100,
+                budget_usage_percent: event.monthly_budget > 0
+                    ? Math.round(data.current_spend / event.monthly_budget * 1000) / 10
+                    : 0
+            };
+        case 'coins_updated':
+            return { ...data, ...stats };
+        default:
+            return data;
+    }
+};
+
 export default function Dashboard({ token, username, onLogout }) {
     const [userData, setUserData] = useState(null);
     const [showPaymentModal, setShowPaymentModal] = useState(false);
@@ -25,6 +88,7 @@ export default function Dashboard({ token, username, onLogout }) {
     const [pinError, setPinError] = useState('');
     const [theme, setTheme] = useState(localStorage.getItem('theme') || 'dark');
     const location = useLocation();
+    const liveSocket = useRef(null);
 
     useEffect(() => {
         document.documentElement.setAttribute('data-theme', theme);
@@ -39,9 +103,48 @@ export default function Dashboard({ token, username, onLogout }) {
         loadDashboard();
     }, []);
 
+    // Live updates: the server pushes deltas after writes instead of us refetching
+    useEffect(() => {
+        const url = new URL(`${API_URL}/ws`, window.location.origin);
+        url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+        url.searchParams.append('token', token);
+
+        const socket = new WebSocket(url);
+        socket.onmessage = (message) => {
+            const event = JSON.parse(message.data);
+            if (event.type === 'resync') {
+                loadDashboard();
+            } else {
+                setUserData(prev => prev && applyLiveUpdate(prev, event));
+            }
+        };
+        liveSocket.current = socket;
+
+        return () => {
+            liveSocket.current = null;
+            socket.close();
+        };
+    }, [token]);
+
+    // Only refetch when live updates aren't connected
+    const refreshIfOffline = () => {
+        if (liveSocket.current?.readyState !== WebSocket.OPEN) {
+            loadDashboard();
+        }
+    };
+
     const loadDashboard = async () => {
         try {
-            const response = await fetch(`${API_URL}/dashboard?token=${token}`);
+            const response = await fetchWithRetry(`${API_URL}/dashboard?token=${token}`);
+            if (response.status === 401) {
+                onLogout();
+                return;
+            }
+            if (!response.ok) {
+                // Keep what we have rather than rendering the error body as dashboard data
+                console.error('Failed to load dashboard:', response.status);
+                return;
+            }
             const data = await response.json();
             setUserData(data);
         } catch (error) {
@@ -130,7 +233,7 @@ export default function Dashboard({ token, username, onLogout }) {
             }
 
             resetState();
-            loadDashboard();
+            refreshIfOffline();
         } catch (error) {
             console.error('Failed to add transaction:', error);
             alert(error.message);
@@ -147,7 +250,7 @@ export default function Dashboard({ token, username, onLogout }) {
                     is_useful: isUseful
                 })
             });
-            loadDashboard();
+            refreshIfOffline();
         } catch (error) {
             console.error('Failed to mark transaction:', error);
         }
@@ -9,14 +9,18 @@ export default function Activity() {
     const { userData } = useOutletContext();
 
     // Format chart data for transaction-level graph
-    const chartData = userData.chart_data.map((point, index) => ({
-        index: index + 1,
-        amount: point.amount,
-        timestamp: new Date(point.timestamp.replace(' ', 'T') + (point.timestamp.includes('Z') ? '' : 'Z')).toLocaleTimeString('en-US', {
-            hour: '2-digit',
-            minute: '2-digit'
-        })
-    }));
+    // Chart points reference their transaction by index instead of repeating it
+    const chartData = userData.chart_data.map((point, index) => {
+        const { timestamp } = userData.transactions[point.txn];
+        return {
+            index: index + 1,
+            amount: point.amount,
+            timestamp: new Date(timestamp.replace(' ', 'T') + (timestamp.includes('Z') ? '' : 'Z')).toLocaleTimeString('en-US', {
+                hour: '2-digit',
+                minute: '2-digit'
+            })
+        };
+    });
 
     return (
         <div className="page-content" style={{ paddingBottom: '100px' }}>